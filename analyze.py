@@ -0,0 +1,118 @@
+# Batch analysis of many positions across a process pool.
+#
+#   python analyze.py positions.jsonl --time 0.5 --processes 8 > results.jsonl
+#   cat positions.txt | python analyze.py - --depth 6
+#
+# Positions are read as a stream, from a file or stdin, in either format:
+#   JSON lines: {"id": "p1", "position": [8 rows], "side": "BLACK", "time": 1.0, "depth": 6}
+#               where id, time and depth are optional and override the command line;
+#   input.txt blocks: the 11 lines of input.txt (mode, side, time, 8 rows) one after another,
+#               with or without empty lines between them; the time line is ignored.
+# Like in a game, a budget under 0.3s plays the first legal move without searching.
+# Every position is searched by Engine.best_move and a JSON line with its id (or number in
+# the input), move in E/J notation, score, depth, nodes and principal variation is written
+# as soon as it is done, so results come out of order. Only a few positions per process are
+# read ahead of the searches, so inputs of any size run in constant memory.
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+
+from checker_ai_bot import Engine
+
+READ_AHEAD = 4  # positions waiting per process
+
+_engine = None
+
+
+def _init_worker():
+    global _engine
+    _engine = Engine()
+
+
+def analyze(task):
+    number, position_id, rows, side, budget, depth = task
+    start = time.time()
+    result = _engine.best_move(rows, side, budget, {"depth": depth})
+    return {
+        "id": position_id if position_id is not None else number,
+        "move": result.notation.replace("\n", " "),
+        "score": result.score,
+        "depth": result.depth,
+        "nodes": result.nodes,
+        "pv": [move.replace("\n", " ") for move in result.pv],
+        "source": result.source,
+        "time": round(time.time() - start, 4),
+    }
+
+
+# (id, rows, side, time, depth) of every position of the stream; None where not given
+def read_positions(f):
+    lines = (line.strip() for line in f)
+    for line in lines:
+        if not line:
+            continue
+        if line.startswith("{"):
+            record = json.loads(line)
+            yield (record.get("id"), record["position"], record.get("side", "BLACK"),
+                   record.get("time"), record.get("depth"))
+        else:
+            # line is the game type, then side, time and the 8 rows follow
+            side = next(lines)
+            next(lines)
+            rows = [next(lines) for i in range(8)]
+            yield None, rows, side, None, None
+
+
+def run(f, out, budget, depth, processes):
+    pool = multiprocessing.Pool(processes, initializer=_init_worker)
+    pending = []
+    done = 0
+    try:
+        for number, (position_id, rows, side, position_time, position_depth) in enumerate(read_positions(f)):
+            task = (number, position_id, rows, side,
+                    position_time if position_time is not None else budget,
+                    position_depth if position_depth is not None else depth)
+            pending.append(pool.apply_async(analyze, (task,)))
+            while len(pending) >= processes * READ_AHEAD:
+                done += write_finished(pending, out, wait=True)
+            done += write_finished(pending, out)
+        while pending:
+            done += write_finished(pending, out, wait=True)
+    finally:
+        pool.close()
+        pool.join()
+    return done
+
+
+# write the results that are ready, waiting for the oldest one first if wait is set;
+# returns how many were written
+def write_finished(pending, out, wait=False):
+    if wait:
+        pending[0].wait()
+    written = 0
+    for result in [r for r in pending if r.ready()]:
+        pending.remove(result)
+        out.write(json.dumps(result.get()) + "\n")
+        written += 1
+    if written:
+        out.flush()
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="analyze a stream of positions in parallel")
+    parser.add_argument("input", help="JSON lines or input.txt blocks, - for stdin")
+    parser.add_argument("--time", type=float, default=1.0, help="seconds per position")
+    parser.add_argument("--depth", type=int, help="deepest iteration per position")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.input == "-":
+        count = run(sys.stdin, sys.stdout, args.time, args.depth, args.processes)
+    else:
+        with open(args.input) as f:
+            count = run(f, sys.stdout, args.time, args.depth, args.processes)
+    sys.stderr.write("{} positions in {:.1f}s\n".format(count, time.time() - start))
@@ -0,0 +1,184 @@
+# Offline builder of the endgame database probed by checker_ai_bot.
+#
+#   python build_endgame_db.py --pieces 4 --output endgame.db
+#
+# Every material slice is solved by retrograde analysis, fewest pieces first, and men
+# before kings for the same number of pieces, so that the positions reached by
+# captures and promotions are already known. Inside a slice the solved positions are
+# processed in order of distance: a loss makes every position that can move into it a
+# win one ply further, and a position whose moves all lead to wins for the opponent
+# becomes a loss one ply beyond the longest of them. Whatever is left unsolved is a draw.
+import argparse
+import itertools
+import time
+from array import array
+
+from checker_ai_bot import (Board, Game, Player, BACKWARD_NEIGHBOURS, MOVE_TABLE, MEN_SQUARE_OFFSET,
+                            ENDGAME_HEADER, ENDGAME_SLICE, ENDGAME_MAGIC, ENDGAME_VERSION, ENDGAME_LOSS,
+                            ENDGAME_MAX_DISTANCE, endgame_material, endgame_slice_size, endgame_index,
+                            endgame_position, iter_squares, opponent_of)
+
+
+# materials with at least one piece a side, in the order they have to be solved
+def endgame_slices(max_pieces):
+    slices = []
+    for total in range(2, max_pieces + 1):
+        for black in range(1, total):
+            for bm in range(black + 1):
+                for wm in range(total - black + 1):
+                    slices.append((bm, black - bm, wm, total - black - wm))
+    slices.sort(key=lambda material: (sum(material), material[0] + material[2]))
+    return slices
+
+
+def to_bits(squares):
+    bb = 0
+    for sq in squares:
+        bb |= 1 << sq
+    return bb
+
+
+# (men, kings) of every legal placement of the material
+def placements(material):
+    bm, bk, wm, wk = material
+    for black_men in itertools.combinations(range(MEN_SQUARE_OFFSET[Player.BLACK], 28), bm):
+        bmen = to_bits(black_men)
+        for black_kings in itertools.combinations(range(32), bk):
+            bkings = to_bits(black_kings)
+            if bmen & bkings:
+                continue
+            black = bmen | bkings
+            for white_men in itertools.combinations(range(MEN_SQUARE_OFFSET[Player.WHITE], 32), wm):
+                wmen = to_bits(white_men)
+                if black & wmen:
+                    continue
+                for white_kings in itertools.combinations(range(32), wk):
+                    wkings = to_bits(white_kings)
+                    if (black | wmen) & wkings:
+                        continue
+                    yield [wmen, bmen], [wkings, bkings]
+
+
+class EndgameBuilder:
+    def __init__(self, max_pieces):
+        self.max_pieces = max_pieces
+        self.tables = {}
+        self.game = Game()
+        self.board = Board()
+
+    # stored byte of a position reached by a capture or promotion, side to move given
+    def lookup(self, player):
+        board = self.board
+        if not (board.men[player] | board.kings[player]):
+            return ENDGAME_LOSS  # no pieces left: lost on the spot
+        material = endgame_material(board)
+        return self.tables[material][endgame_index(material, board.men, board.kings, player)]
+
+    # indexes of the positions, inside the slice, whose side to move can reach this one
+    def predecessors(self, material, index):
+        men, kings, player = endgame_position(material, index)
+        mover = opponent_of(player)
+        occupied = men[0] | men[1] | kings[0] | kings[1]
+        board = self.board
+        result = []
+        for bitboards, origins in ((men, BACKWARD_NEIGHBOURS[mover]), (kings, MOVE_TABLE[mover][1])):
+            for to in iter_squares(bitboards[mover]):
+                for frm in origins[to]:
+                    if occupied >> frm & 1:
+                        continue
+                    bitboards[mover] ^= (1 << to) | (1 << frm)
+                    board.men = men
+                    board.kings = kings
+                    # a simple move is only legal when the mover had nothing to capture
+                    if not board.get_jumpers(mover):
+                        result.append(endgame_index(material, men, kings, mover))
+                    bitboards[mover] ^= (1 << to) | (1 << frm)
+        return result
+
+    def solve(self, material):
+        size = endgame_slice_size(material)
+        values = bytearray(size)
+        done = bytearray(size)
+        counts = bytearray(size)     # moves staying in the slice that are not known to lose
+        longest = bytearray(size)    # longest known win of the opponent after one of our moves
+        can_hold = bytearray(size)   # some move avoids a loss: never a loss
+        buckets = {}
+        board = self.board
+
+        for men, kings in placements(material):
+            for player in (Player.WHITE, Player.BLACK):
+                index = endgame_index(material, men, kings, player)
+                board.men = men[:]
+                board.kings = kings[:]
+                opponent = opponent_of(player)
+                moves = self.game.get_all_moves(board, player)
+                win = None
+                for move in moves:
+                    undo = board.push(move, player)
+                    if endgame_material(board) == material:
+                        counts[index] += 1
+                    else:
+                        value = self.lookup(opponent)
+                        if value >= ENDGAME_LOSS:
+                            distance = value - ENDGAME_LOSS + 1
+                            win = distance if win is None else min(win, distance)
+                            can_hold[index] = 1
+                        elif value > 0:
+                            longest[index] = max(longest[index], value)
+                        else:
+                            can_hold[index] = 1
+                    board.pop(undo)
+                if win is not None:
+                    buckets.setdefault(win, array('Q')).append(index * 2 + 1)
+                elif not counts[index] and not can_hold[index]:
+                    distance = longest[index] + 1 if moves else 0
+                    buckets.setdefault(distance, array('Q')).append(index * 2)
+
+        distance = 0
+        while buckets:
+            for entry in buckets.pop(distance, ()):
+                index = entry >> 1
+                if done[index]:
+                    continue
+                done[index] = 1
+                if entry & 1:
+                    values[index] = min(distance, ENDGAME_MAX_DISTANCE)
+                else:
+                    values[index] = ENDGAME_LOSS + min(distance, ENDGAME_MAX_DISTANCE)
+                for previous in self.predecessors(material, index):
+                    if done[previous]:
+                        continue
+                    if not entry & 1:
+                        buckets.setdefault(distance + 1, array('Q')).append(previous * 2 + 1)
+                        continue
+                    counts[previous] -= 1
+                    longest[previous] = max(longest[previous], min(distance, 255))
+                    if not counts[previous] and not can_hold[previous]:
+                        buckets.setdefault(longest[previous] + 1, array('Q')).append(previous * 2)
+            distance += 1
+        self.tables[material] = values
+
+    def build(self, output):
+        slices = endgame_slices(self.max_pieces)
+        for material in slices:
+            start = time.time()
+            self.solve(material)
+            print("slice {} ({} positions) solved in {:.1f}s".format(
+                material, endgame_slice_size(material), time.time() - start))
+
+        with open(output, 'wb') as f:
+            offset = ENDGAME_HEADER.size + ENDGAME_SLICE.size * len(slices)
+            f.write(ENDGAME_HEADER.pack(ENDGAME_MAGIC, ENDGAME_VERSION, self.max_pieces, len(slices)))
+            for material in slices:
+                f.write(ENDGAME_SLICE.pack(*(material + (offset, len(self.tables[material])))))
+                offset += len(self.tables[material])
+            for material in slices:
+                f.write(self.tables[material])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="build the checkers endgame database")
+    parser.add_argument("--pieces", type=int, default=4, help="largest number of pieces on the board")
+    parser.add_argument("--output", default="endgame.db")
+    args = parser.parse_args()
+    EndgameBuilder(args.pieces).build(args.output)
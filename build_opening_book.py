@@ -0,0 +1,127 @@
+# Offline builder of the opening book consulted by checker_ai_bot.
+#
+#   python build_opening_book.py --games 200 --move-time 0.5 --output opening.book
+#   python build_opening_book.py --import games.txt --output opening.book
+#
+# Games either come from self-play of the engine, with a few random moves at the start
+# so that the games differ, or from a record file holding one game per line: the result
+# (B, W or D) followed by the moves, e.g. "B f6-e5 c3-d4 e5xc3 ...", jumps written as
+# "c3xe5xg7". The moves played in the first plies of every game are gathered per position
+# and weighted by how the game ended for the side that played them.
+import argparse
+import random
+import time
+
+from checker_ai_bot import (Game, GameType, Player, BOOK_MAGIC, BOOK_VERSION, BOOK_HEADER, BOOK_RECORD,
+                            COL_MAP, ROW_MAP, START_POSITION, square, opponent_of, self_play_game)
+
+RESULT_POINTS = {"win": 2, "draw": 1, "loss": 0}
+MAX_WEIGHT = 0xFFFF
+
+
+# square of a field like "f6"
+def parse_field(field):
+    col = [c for c, name in COL_MAP.items() if name == field[0]][0]
+    row = [r for r, name in ROW_MAP.items() if name == int(field[1:])][0]
+    return square(row, col)
+
+
+class BookBuilder:
+    def __init__(self, plies):
+        self.plies = plies
+        self.entries = {}  # (key, from, to) -> weight
+
+    def new_game(self):
+        game = Game()
+        game.gameType = GameType.GAME
+        game.turn = Player.BLACK
+        game.create_board_from_input([list(row) for row in START_POSITION])
+        return game
+
+    # add the book plies of a finished game; winner is a Player or None for a draw
+    def record(self, positions, winner):
+        for key, player, frm, to in positions[:self.plies]:
+            if winner is None:
+                points = RESULT_POINTS["draw"]
+            elif winner == player:
+                points = RESULT_POINTS["win"]
+            else:
+                points = RESULT_POINTS["loss"]
+            entry = (key, frm, to)
+            self.entries[entry] = min(self.entries.get(entry, 0) + points + 1, MAX_WEIGHT)
+
+    # one engine game; the winner, or None when it reaches max_plies
+    def self_play(self, move_time, random_plies, max_plies):
+        positions = []
+
+        def new_game(player, tt, move_orderer):
+            game = Game(tt, move_orderer)
+            game.gameType = GameType.GAME
+            return game
+
+        def choose(game, ply):
+            if ply < random_plies:
+                move = random.choice(game.get_all_moves(game.gameBoard, game.turn))
+            else:
+                game.start_time = time.time()
+                game.remaining_time = move_time * 10
+                game.allowed_time = game.start_time + move_time
+                move = game.get_best_move()
+            positions.append((game.gameBoard.get_key(game.turn), game.turn, move[0], move[1][-1]))
+            return move
+
+        winner = self_play_game(new_game, choose, max_plies)
+        self.record(positions, winner)
+        return winner
+
+    # replay a record line, raising ValueError on a move that is not legal
+    def import_game(self, line):
+        tokens = line.split()
+        if not tokens:
+            return
+        winner = {"B": Player.BLACK, "W": Player.WHITE, "D": None}[tokens[0].upper()]
+        game = self.new_game()
+        positions = []
+        for token in tokens[1:self.plies + 1]:
+            fields = [parse_field(f) for f in token.replace("x", "-").split("-")]
+            legal = [m for m in game.get_all_moves(game.gameBoard, game.turn)
+                     if m[0] == fields[0] and list(m[1]) == fields[1:]]
+            if not legal:
+                raise ValueError("illegal move {} in: {}".format(token, line.strip()))
+            positions.append((game.gameBoard.get_key(game.turn), game.turn, fields[0], fields[-1]))
+            game.gameBoard.push(legal[0], game.turn)
+            game.turn = opponent_of(game.turn)
+        self.record(positions, winner)
+
+    def write(self, output):
+        records = sorted(self.entries.items())
+        with open(output, 'wb') as f:
+            f.write(BOOK_HEADER.pack(BOOK_MAGIC, BOOK_VERSION, len(records)))
+            for (key, frm, to), weight in records:
+                f.write(BOOK_RECORD.pack(key, frm, to, weight))
+        return len(records)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="build the checkers opening book")
+    parser.add_argument("--games", type=int, default=100, help="number of self-play games")
+    parser.add_argument("--move-time", type=float, default=0.5, help="seconds per self-play move")
+    parser.add_argument("--random-plies", type=int, default=2, help="random moves opening each self-play game")
+    parser.add_argument("--max-plies", type=int, default=200, help="self-play games longer than this are draws")
+    parser.add_argument("--plies", type=int, default=20, help="plies of every game kept in the book")
+    parser.add_argument("--import", dest="records", help="game record file used instead of self-play")
+    parser.add_argument("--output", default="opening.book")
+    args = parser.parse_args()
+
+    builder = BookBuilder(args.plies)
+    if args.records:
+        with open(args.records) as f:
+            for line in f:
+                builder.import_game(line)
+    else:
+        results = {Player.BLACK: 0, Player.WHITE: 0, None: 0}
+        for i in range(args.games):
+            results[builder.self_play(args.move_time, args.random_plies, args.max_plies)] += 1
+            print("game {}: black {} white {} draws {}".format(
+                i + 1, results[Player.BLACK], results[Player.WHITE], results[None]))
+    print("{} book entries written to {}".format(builder.write(args.output), args.output))
@@ -1,16 +1,46 @@
-from copy import deepcopy
-from random import randint
+from random import Random
+import bisect
 import time
 import os.path
+import sys
+import mmap
+import struct
+import json
+import threading
+import zlib
+# multiprocessing, socket and argparse are imported where they are used, so that importing
+# the engine as a library stays cheap
 
 num = ""
 INPUT_FILE = "input" + str(num) + ".txt"
 OUTPUT_FILE = "output" + str(num) + ".txt"
 PLAYDATA_FILE = "playdata.txt"
+TT_SIZE_MB = 16  # memory budget of the transposition table
+SEARCH_WORKERS = 1  # processes searching root moves in Game.play, 1 searches in this process
+TIME_CHECK_MASK = 1023  # the search looks at the clock once every 1024 nodes
+ASPIRATION_WINDOW = 20  # half width of the first root window around the previous iteration's score
+PONDER_MAX_DEPTH = 24  # pondering stops after this iteration if the opponent has not moved yet
+PONDER_IDLE_EXIT = 600  # seconds without a new input.txt after which --ponder without --daemon exits
+ENDGAME_DB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "endgame.db")
+OPENING_BOOK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening.book")
+EVAL_WEIGHTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval_weights.json")
+TT_SNAPSHOT_FILE = "tt.snapshot"  # state of one game, kept next to playdata.txt; None: off
+TT_SNAPSHOT_ENTRIES = 16384  # deepest transposition table entries driver() keeps for its next run
+TT_SNAPSHOT_MAX_AGE = 3  # ... for at most this many more moves when the search does not renew them
+BOOK_MOVES = 10  # own moves of a GAME answered from the opening book when it knows the position
+BATCH_EVAL = False  # evaluate the quiet children of depth-1 nodes together (needs numpy)
+BATCH_MIN_POSITIONS = 24  # ... when there are at least this many; fewer are faster one by one
+LATE_MOVE_REDUCTIONS = True  # quiet moves late in the order are searched a ply shallower first
+LMR_MIN_DEPTH = 3  # ... at nodes with at least this depth left
+LMR_FIRST_MOVE = 3  # ... from this move of the order on
+FUTILITY_PRUNING = True  # skip quiet moves near the leaves when the static evaluation is far below alpha
+FUTILITY_MARGINS = (0, 20, 40)  # margin by depth left; no pruning further from the leaves
+SEARCH_EXTENSIONS = True  # search a ply deeper after a forced single reply or a capture
+SELECTIVE_EXTRA_DEPTH = 2  # iterations allowed past the usual maximum depth with reductions or pruning on
+NOISE_SEED = None  # seed of the evaluation noise and the book's random picks; None: new every run
+STATS_FILE = None  # search statistics are appended here as JSON lines, "-" for stderr; off when None
 ROW_MAP = {0: 8, 1: 7, 2: 6, 3: 5, 4: 4, 5: 3, 6: 2, 7: 1}
 COL_MAP = {0: 'a', 1: 'b', 2: 'c', 3: 'd', 4: 'e', 5: 'f', 6: 'g', 7: 'h'}
-UP = [(-2, -2), (-2, 2)]  # for white players
-DOWN = [(2, -2), (2, 2)]  # for black players
 
 
 class GameType:
@@ -23,6 +53,23 @@ class Player:
     BLACK = 1
 
 
+def opponent_of(player):
+    return Player.WHITE if player == Player.BLACK else Player.BLACK
+
+
+# rows of the initial position in the input.txt format, black to move
+START_POSITION = [
+    ".b.b.b.b",
+    "b.b.b.b.",
+    ".b.b.b.b",
+    "........",
+    "........",
+    "w.w.w.w.",
+    ".w.w.w.w",
+    "w.w.w.w.",
+]
+
+
 class Piece:
     def __init__(self, row, col, color):
         self.color = color
@@ -58,83 +105,402 @@ class Piece:
         self.down = True
 
     def get_opponent_player(self):
-        opponent = Player.WHITE if self.player == Player.BLACK else Player.BLACK
+        opponent = opponent_of(self.player)
         return opponent
 
 
+####################### Bitboards ####################################################
+# The 32 dark squares are numbered row by row, four to a row, so (row, col) is
+# square row * 4 + col // 2 and bit n of a bitboard is set when square n is taken.
+FULL_MASK = 0xFFFFFFFF
+EVEN_ROWS = 0x0F0F0F0F  # rows 0, 2, 4, 6 (dark squares on odd columns)
+ODD_ROWS = 0xF0F0F0F0   # rows 1, 3, 5, 7 (dark squares on even columns)
+SHIFT3_MASK = 0xE0E0E0E0  # odd rows without column 0
+SHIFT5_MASK = 0x07070707  # even rows without column 7
+
+SQUARE_ROW = [sq // 4 for sq in range(32)]
+SQUARE_COL = [2 * (sq % 4) + (1 if (sq // 4) % 2 == 0 else 0) for sq in range(32)]
+ROW_MASKS = [0xF << (4 * r) for r in range(8)]
+PROMOTION_ROW = [ROW_MASKS[0], ROW_MASKS[7]]  # indexed by Player
+EDGE_MASK = 0
+for _sq in range(32):
+    if SQUARE_ROW[_sq] in (0, 7) or SQUARE_COL[_sq] in (0, 7):
+        EDGE_MASK |= 1 << _sq
+EDGE_SQUARE = [(EDGE_MASK >> sq) & 1 for sq in range(32)]
+# weights of the evaluation features, seen from the player evaluated; tune_eval.py fits
+# them to game results and writes EVAL_WEIGHTS_FILE, which replaces them at import
+EVAL_WEIGHTS = {
+    "edge": 7,               # pieces of either side on the edge squares
+    "opponent_jumps": -10,   # jumps the opponent has
+    "opponent_no_jump": 3,   # opponent pieces that cannot jump
+    "opponent_blocked": 3,   # opponent pieces that cannot move
+    "jumps": 10,             # jumps the player has
+    "pieces": 1,             # pieces on the board
+    "material": 5,           # own pieces minus the opponent's
+    "kings": 7,              # own kings minus the opponent's
+    "advance": 1,            # king_row_dist: rows advanced by each man ...
+    "near_promotion": 3,     # ... and men one row before promotion, averaged over own pieces
+}
+
+
+# king_row_dist share of a man on each square
+def advance_table(advance, near_promotion):
+    return [[(7 - SQUARE_ROW[sq]) * advance + (near_promotion if SQUARE_ROW[sq] == 1 else 0) for sq in range(32)],
+            [SQUARE_ROW[sq] * advance + (near_promotion if SQUARE_ROW[sq] == 6 else 0) for sq in range(32)]]
+
+
+ADVANCE = advance_table(EVAL_WEIGHTS["advance"], EVAL_WEIGHTS["near_promotion"])
+# the weights of get_board_pieces_valuation in the order it reads them
+PIECE_WEIGHT_NAMES = ("edge", "opponent_jumps", "opponent_no_jump", "opponent_blocked", "jumps",
+                      "pieces", "material", "kings")
+PIECE_WEIGHTS = tuple(EVAL_WEIGHTS[name] for name in PIECE_WEIGHT_NAMES)
+
+try:
+    popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def popcount(bb):
+        return bin(bb).count("1")
+
+
+def square(row, col):
+    return row * 4 + col // 2
+
+
+def bit_square(bit):
+    return bit.bit_length() - 1
+
+
+def iter_squares(bb):
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+# one diagonal step for every piece on the bitboard
+def up_left(bb):
+    return ((bb & SHIFT3_MASK) >> 5) | ((bb & EVEN_ROWS) >> 4)
+
+
+def up_right(bb):
+    return ((bb & ODD_ROWS) >> 4) | ((bb & SHIFT5_MASK) >> 3)
+
+
+def down_left(bb):
+    return (((bb & SHIFT3_MASK) << 3) | ((bb & EVEN_ROWS) << 4)) & FULL_MASK
+
+
+def down_right(bb):
+    return (((bb & ODD_ROWS) << 4) | ((bb & SHIFT5_MASK) << 5)) & FULL_MASK
+
+
+# Zobrist keys: one per (player, square) for men and for kings, plus the side to move.
+# Seeded so keys are identical in every process.
+_zobrist_rng = Random(0x5EED)
+ZOBRIST_MEN = [[_zobrist_rng.getrandbits(64) for sq in range(32)] for player in range(2)]
+ZOBRIST_KINGS = [[_zobrist_rng.getrandbits(64) for sq in range(32)] for player in range(2)]
+ZOBRIST_SIDE = _zobrist_rng.getrandbits(64)  # xor-ed in when black is to move
+ZOBRIST_ROOT = _zobrist_rng.getrandbits(64)  # xor-ed into search keys when the search is for black
+
+# Random numbers of the evaluation noise, of batch_evaluation's (numpy, made on first
+# use) and of the opening book picks. Seeded with seed_noise so that searches repeat
+# exactly, given a depth limit instead of a clock.
+_noise_seed = NOISE_SEED
+_noise_rng = Random(_noise_seed)
+randint = _noise_rng.randint
+_batch_noise_rng = None
+
+
+def seed_noise(seed):
+    global _noise_seed, _batch_noise_rng
+    _noise_seed = seed
+    _noise_rng.seed(seed)
+    _batch_noise_rng = None
+
+
+# (step, opposite step, player whose men move that way)
+DIRECTIONS = ((up_left, down_right, Player.WHITE), (up_right, down_left, Player.WHITE),
+              (down_left, up_right, Player.BLACK), (down_right, up_left, Player.BLACK))
+
+# Square adjacency, built once at import. For every player and square: the neighbours one
+# step forward/backward and the (via, landing) squares of the jumps in those directions.
+def _adjacency(sq, player, forward):
+    neighbours = ()
+    jumps = ()
+    for step, back, direction_player in DIRECTIONS:
+        if (direction_player == player) != forward:
+            continue
+        via = step(1 << sq)
+        if via:
+            neighbours += (bit_square(via),)
+            if step(via):
+                jumps += ((bit_square(via), bit_square(step(via))),)
+    return neighbours, jumps
+
+
+FORWARD_NEIGHBOURS = [[_adjacency(sq, p, True)[0] for sq in range(32)] for p in range(2)]
+BACKWARD_NEIGHBOURS = [[_adjacency(sq, p, False)[0] for sq in range(32)] for p in range(2)]
+FORWARD_JUMPS = [[_adjacency(sq, p, True)[1] for sq in range(32)] for p in range(2)]
+BACKWARD_JUMPS = [[_adjacency(sq, p, False)[1] for sq in range(32)] for p in range(2)]
+
+# what a piece may use, indexed [player][is king][square]
+MOVE_TABLE = [[tuple(FORWARD_NEIGHBOURS[p]),
+               tuple(f + b for f, b in zip(FORWARD_NEIGHBOURS[p], BACKWARD_NEIGHBOURS[p]))] for p in range(2)]
+JUMP_TABLE = [[tuple(FORWARD_JUMPS[p]),
+               tuple(f + b for f, b in zip(FORWARD_JUMPS[p], BACKWARD_JUMPS[p]))] for p in range(2)]
+
+
 class Board:
     def __init__(self):
-        self.board = []
-        self.white_left = 0
-        self.black_left = 0
-        self.white_kings = 0
-        self.black_kings = 0
+        self.men = [0, 0]    # bitboards indexed by Player
+        self.kings = [0, 0]
+        self.hash = 0        # Zobrist key of the pieces, kept up to date by every move
+        # evaluation terms kept up to date by every move:
+        # (pieces on edge squares, ADVANCE sum of white men, ADVANCE sum of black men)
+        self.eval_terms = (0, 0, 0)
         self.rows = 8
         self.cols = 8
 
-    # get all pieces of given color
-    def get_all_pieces(self, player):
+    def copy(self):
+        board = Board()
+        board.men = self.men[:]
+        board.kings = self.kings[:]
+        board.hash = self.hash
+        board.eval_terms = self.eval_terms
+        return board
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    # transposition key of the position with player to move; given root, the key of the
+    # position in a search for root, since the evaluation is not zero-sum and the scores
+    # of one position differ with the side the search is run for
+    def get_key(self, player, root=None):
+        key = self.hash ^ ZOBRIST_SIDE if player == Player.BLACK else self.hash
+        return key ^ ZOBRIST_ROOT if root == Player.BLACK else key
+
+    def compute_eval_terms(self):
+        advancement = [0, 0]
+        for player in (Player.WHITE, Player.BLACK):
+            for sq in iter_squares(self.men[player]):
+                advancement[player] += ADVANCE[player][sq]
+        return popcount(self.get_occupied() & EDGE_MASK), advancement[0], advancement[1]
+
+    # add (sign 1) or take away (sign -1) one piece's share of the evaluation terms
+    def update_eval_terms(self, player, sq, king, sign):
+        edge, white, black = self.eval_terms
+        edge += EDGE_SQUARE[sq] * sign
+        if not king:
+            if player == Player.WHITE:
+                white += ADVANCE[player][sq] * sign
+            else:
+                black += ADVANCE[player][sq] * sign
+        self.eval_terms = (edge, white, black)
+
+    def compute_hash(self):
+        key = 0
+        for player in (Player.WHITE, Player.BLACK):
+            for sq in iter_squares(self.men[player]):
+                key ^= ZOBRIST_MEN[player][sq]
+            for sq in iter_squares(self.kings[player]):
+                key ^= ZOBRIST_KINGS[player][sq]
+        return key
+
+    @property
+    def white_left(self):
+        return popcount(self.men[Player.WHITE] | self.kings[Player.WHITE])
+
+    @property
+    def black_left(self):
+        return popcount(self.men[Player.BLACK] | self.kings[Player.BLACK])
+
+    @property
+    def white_kings(self):
+        return popcount(self.kings[Player.WHITE])
+
+    @property
+    def black_kings(self):
+        return popcount(self.kings[Player.BLACK])
+
+    def get_pieces(self, player):
+        return self.men[player] | self.kings[player]
+
+    def get_occupied(self):
+        return self.men[0] | self.men[1] | self.kings[0] | self.kings[1]
+
+    # get all pieces of given color, optionally limited to the squares in mask
+    def get_all_pieces(self, player, mask=FULL_MASK):
         pieces = []
-        for row in self.board:
-            for p in row:
-                if p is not None and p.player == player:
-                    pieces.append(p)
+        for sq in iter_squares((self.men[player] | self.kings[player]) & mask):
+            pieces.append(self.get_piece(SQUARE_ROW[sq], SQUARE_COL[sq]))
         return pieces
 
+    # pieces of player which have at least one jump
+    def get_jumpers(self, player):
+        opponent = self.men[1 - player] | self.kings[1 - player]
+        empty = ~(opponent | self.men[player] | self.kings[player]) & FULL_MASK
+        jumpers = 0
+        for step, back, forward in DIRECTIONS:
+            movers = self.kings[player] | self.men[player] if forward == player else self.kings[player]
+            if movers:
+                jumpers |= back(back(empty) & opponent) & movers
+        return jumpers
+
+    # pieces of player which have at least one diagonal move
+    def get_movers(self, player):
+        empty = ~self.get_occupied() & FULL_MASK
+        movers = 0
+        for step, back, forward in DIRECTIONS:
+            pieces = self.kings[player] | self.men[player] if forward == player else self.kings[player]
+            if pieces:
+                movers |= back(empty) & pieces
+        return movers
+
+    # number of jump directions summed over all pieces of player and the pieces having any
+    def count_jumps(self, player, empty):
+        opponent = self.men[1 - player] | self.kings[1 - player]
+        count = 0
+        jumpers = 0
+        for step, back, forward in DIRECTIONS:
+            pieces = self.kings[player] | self.men[player] if forward == player else self.kings[player]
+            if not pieces:
+                continue
+            sources = back(back(empty) & opponent) & pieces
+            if sources:
+                count += popcount(sources)
+                jumpers |= sources
+        return count, jumpers
+
     def make_move(self, piece, r, c):
-        self.board[piece.row][piece.col] = None
-        self.board[r][c] = piece
+        player = piece.player
+        frm_sq = square(piece.row, piece.col)
+        to_sq = square(r, c)
+        frm = 1 << frm_sq
+        to = 1 << to_sq
+        if piece.isKing():
+            self.kings[player] ^= frm | to
+            self.hash ^= ZOBRIST_KINGS[player][frm_sq] ^ ZOBRIST_KINGS[player][to_sq]
+        else:
+            self.men[player] ^= frm | to
+            self.hash ^= ZOBRIST_MEN[player][frm_sq] ^ ZOBRIST_MEN[player][to_sq]
+        self.update_eval_terms(player, frm_sq, piece.isKing(), -1)
+        self.update_eval_terms(player, to_sq, piece.isKing(), 1)
         piece.row = r
         piece.col = c
 
         # check if row or column is king line
         if not piece.isKing() and (r == 0 or r == self.rows - 1):
+            self.update_eval_terms(player, to_sq, False, -1)
             piece.make_king()
-            if piece.color == 'W':
-                self.white_kings += 1
-            else:
-                self.black_kings += 1
+            self.men[player] ^= to
+            self.kings[player] |= to
+            self.hash ^= ZOBRIST_MEN[player][to_sq] ^ ZOBRIST_KINGS[player][to_sq]
+            self.update_eval_terms(player, to_sq, True, 1)
 
     def remove_captured_pieces(self, pieces):
         for piece in pieces:
-            self.board[piece.row][piece.col] = None
             if piece is not None:
-                if piece.player == Player.BLACK:
-                    self.black_left -= 1
-                    if piece.isKing():
-                        self.black_kings -= 1
+                sq = square(piece.row, piece.col)
+                bit = 1 << sq
+                if self.men[piece.player] & bit:
+                    self.men[piece.player] ^= bit
+                    self.hash ^= ZOBRIST_MEN[piece.player][sq]
+                    self.update_eval_terms(piece.player, sq, False, -1)
+                elif self.kings[piece.player] & bit:
+                    self.kings[piece.player] ^= bit
+                    self.hash ^= ZOBRIST_KINGS[piece.player][sq]
+                    self.update_eval_terms(piece.player, sq, True, -1)
+
+    # Apply a (from, path, captured) move in place and return the record pop needs to revert it:
+    # (move, player, moved piece was a king, promoted, captured men, captured kings,
+    #  previous hash, previous evaluation terms)
+    def push(self, move, player):
+        frm, path, captured = move
+        to = path[-1]
+        frm_bit = 1 << frm
+        to_bit = 1 << to
+        opponent = 1 - player
+        old_hash = key = self.hash
+        old_terms = self.eval_terms
+        edge = EDGE_SQUARE[to] - EDGE_SQUARE[frm]
+        own = 0
+        other = 0
+        captured_men = 0
+        captured_kings = 0
+        if captured:
+            for sq in captured:
+                bit = 1 << sq
+                edge -= EDGE_SQUARE[sq]
+                if self.men[opponent] & bit:
+                    captured_men |= bit
+                    key ^= ZOBRIST_MEN[opponent][sq]
+                    other -= ADVANCE[opponent][sq]
                 else:
-                    self.white_left -= 1
-                    if piece.isKing():
-                            self.white_kings -= 1
+                    captured_kings |= bit
+                    key ^= ZOBRIST_KINGS[opponent][sq]
+            self.men[opponent] ^= captured_men
+            self.kings[opponent] ^= captured_kings
+
+        king = (self.kings[player] & frm_bit) != 0
+        promoted = False
+        if king:
+            self.kings[player] ^= frm_bit ^ to_bit
+            key ^= ZOBRIST_KINGS[player][frm] ^ ZOBRIST_KINGS[player][to]
+        elif to_bit & PROMOTION_ROW[player]:
+            self.men[player] ^= frm_bit
+            self.kings[player] |= to_bit
+            key ^= ZOBRIST_MEN[player][frm] ^ ZOBRIST_KINGS[player][to]
+            own -= ADVANCE[player][frm]
+            promoted = True
+        else:
+            self.men[player] ^= frm_bit | to_bit
+            key ^= ZOBRIST_MEN[player][frm] ^ ZOBRIST_MEN[player][to]
+            own += ADVANCE[player][to] - ADVANCE[player][frm]
+        self.hash = key
+        if player == Player.WHITE:
+            self.eval_terms = (old_terms[0] + edge, old_terms[1] + own, old_terms[2] + other)
+        else:
+            self.eval_terms = (old_terms[0] + edge, old_terms[1] + other, old_terms[2] + own)
+        return move, player, king, promoted, captured_men, captured_kings, old_hash, old_terms
+
+    def pop(self, undo):
+        move, player, king, promoted, captured_men, captured_kings, self.hash, self.eval_terms = undo
+        frm_bit = 1 << move[0]
+        to_bit = 1 << move[1][-1]
+        if king:
+            self.kings[player] ^= frm_bit ^ to_bit
+        elif promoted:
+            self.kings[player] ^= to_bit
+            self.men[player] |= frm_bit
+        else:
+            self.men[player] ^= frm_bit | to_bit
+        opponent = 1 - player
+        self.men[opponent] |= captured_men
+        self.kings[opponent] |= captured_kings
 
     def create_board(self, boardState):
-        self.board = []
+        self.men = [0, 0]
+        self.kings = [0, 0]
         for r in range(self.rows):
-            self.board.append([])
             for c in range(self.cols):
-                if boardState[r][c] != ".":
-                    piece = Piece(r, c, boardState[r][c])
-                    self.board[r].append(piece)
-                    self.update_piece_count(piece)
+                color = boardState[r][c]
+                if color == ".":
+                    continue
+                bit = 1 << square(r, c)
+                player = Player.BLACK if color == 'b' or color == 'B' else Player.WHITE
+                if color == 'B' or color == 'W':
+                    self.kings[player] |= bit
                 else:
-                    self.board[r].append(None)
-
-    def update_piece_count(self, piece):
-        if piece.color == 'b' or piece.color == 'B':
-            self.black_left += 1
-            if piece.color == 'B':
-                self.black_kings += 1
-        else:
-            self.white_left += 1
-            if piece.color == 'W':
-                self.white_kings += 1
+                    self.men[player] |= bit
+        self.hash = self.compute_hash()
+        self.eval_terms = self.compute_eval_terms()
 
     def get_board_state(self):
-        return self.board
+        return [[self.get_piece(r, c) for c in range(self.cols)] for r in range(self.rows)]
 
     def is_game_over(self):
-        if self.black_left <= 0 or self.white_left <= 0:
+        if not (self.men[Player.BLACK] | self.kings[Player.BLACK]) or \
+           not (self.men[Player.WHITE] | self.kings[Player.WHITE]):
             return True
         return False
 
@@ -146,12 +512,11 @@ class Board:
             print("{:2d}|".format(i), end=" ")
         print()
 
-        i = 0
-        for row in self.board:
+        for i in range(self.rows):
             print("-"*35)
             print("{:2d}|".format(i), end=" ")
-            i+=1
-            for p in row:
+            for j in range(self.cols):
+                p = self.get_piece(i, j)
                 if p:
                     print("{:2}|".format(p.color).rjust(2), end=" ")
                 else:
@@ -176,115 +541,59 @@ class Board:
             return val
 
     def get_board_pieces_valuation(self, player):
-        result = 0
-        opponent = Player.BLACK if player == Player.WHITE else Player.WHITE
-
-        for i in range(8):
-            for j in range(8):
-                piece = self.board[i][j]
-                if not piece:
-                    continue
-
-                # safe at conrners
-                if i == 0 or j == 0 or i == 7 or j == 7:
-                    result += 7
-
-                if piece.player == opponent:
-                    jumps = self.get_jump_directions(piece)
-                    if len(jumps) == 0:
-                        result += 3
-                    result -= len(jumps)*10
-                    normal_moves = self.get_diagonal_directions(piece)
-                    if len(normal_moves) == 0:
-                        result += 3
-
-                if piece.player == player:
-                    jumps = self.get_jump_directions(piece)
-                    result += len(jumps)*10
-
-        total = self.black_left + self.white_left
+        (edge_weight, opponent_jumps_weight, no_jump_weight, blocked_weight, jumps_weight,
+         pieces_weight, material_weight, kings_weight) = PIECE_WEIGHTS
+        opponent = opponent_of(player)
+        occupied = self.get_occupied()
+        empty = ~occupied & FULL_MASK
+
+        # safe at conrners
+        result = self.eval_terms[0] * edge_weight
+
+        opponent_pieces = popcount(self.men[opponent] | self.kings[opponent])
+        jumps, jumpers = self.count_jumps(opponent, empty)
+        result += jumps * opponent_jumps_weight
+        result += (opponent_pieces - popcount(jumpers)) * no_jump_weight
+        result += (opponent_pieces - popcount(self.get_movers(opponent))) * blocked_weight
+
+        jumps = self.count_jumps(player, empty)[0]
+        result += jumps * jumps_weight
+
+        black_left = popcount(self.men[Player.BLACK] | self.kings[Player.BLACK])
+        white_left = popcount(self.men[Player.WHITE] | self.kings[Player.WHITE])
+        total = (black_left + white_left) * pieces_weight
         if player == Player.BLACK:
-            total += (self.black_left - self.white_left) * 5
-            total += (self.black_kings - self.white_kings) * 7
+            total += (black_left - white_left) * material_weight
+            total += (popcount(self.kings[Player.BLACK]) - popcount(self.kings[Player.WHITE])) * kings_weight
         else:
-            total += (self.white_left - self.black_left) * 5
-            total += (self.white_kings - self.black_kings) * 7
+            total += (white_left - black_left) * material_weight
+            total += (popcount(self.kings[Player.WHITE]) - popcount(self.kings[Player.BLACK])) * kings_weight
 
         result += total
         return result
 
+    # average advancement of the player's pieces, read from the incremental terms
     def king_row_dist(self, player):
-        val = 0
-        if player == Player.BLACK:
-            for r in range(self.rows):
-                for c in range(self.cols):
-                    # King rows
-                    piece = self.board[r][c]
-                    if not piece:
-                        continue
-                    if piece.color == 'b':
-                        val += piece.row
-                    if r == 6 and piece.color == 'b':
-                        val += 3
-            if self.black_left > 0:
-                val = val//self.black_left
-                return val
-            else:
-                return 0
-
-        else:
-            for r in range(self.rows):
-                for c in range(self.cols):
-                    # King rows
-                    piece = self.board[r][c]
-                    if not piece:
-                        continue
-                    if piece.color == 'w':
-                        val += 7 - piece.row
-                    if r == 1 and piece.color == 'w':
-                        val += 3
-            if self.white_left > 0:
-                val = val//self.white_left
-                return val
-            else:
-                return 0
+        left = popcount(self.men[player] | self.kings[player])
+        if left > 0:
+            return self.eval_terms[1 + player]//left
+        return 0
 
     def get_diagonal_directions(self, piece):
         directions = []
-        left = piece.col - 1
-        right = piece.col + 1
-        if piece.up:
-            to = (piece.row - 1, left)
-            if self.is_valid_diagonal_move(piece, to):
-                directions.append(to)
-            to = (piece.row - 1, right)
-            if self.is_valid_diagonal_move(piece, to):
-                directions.append(to)
-        if piece.down:
-            to = (piece.row + 1, left)
-            if self.is_valid_diagonal_move(piece, to):
-                directions.append(to)
-            to = (piece.row + 1, right)
-            if self.is_valid_diagonal_move(piece, to):
-                directions.append(to)
+        occupied = self.get_occupied()
+        for to in MOVE_TABLE[piece.player][piece.isKing()][square(piece.row, piece.col)]:
+            if not occupied >> to & 1:
+                directions.append((SQUARE_ROW[to], SQUARE_COL[to]))
         return directions
 
     def get_jump_directions(self, piece):
         directions = {}
-        # left = piece.col - 1
-        # right = piece.col + 1
-        if piece.up:
-            for dir in UP:
-                to = (piece.row+dir[0], piece.col+dir[1])
-                via = (piece.row+(dir[0]//2), piece.col + (dir[1]//2))
-                if self.is_valid_jump(piece, to, via):
-                    directions[to] = via
-        if piece.down:  # piece is moving down
-            for dir in DOWN:
-                to = (piece.row+dir[0], piece.col+dir[1])
-                via = (piece.row+(dir[0]//2), piece.col + (dir[1]//2))
-                if self.is_valid_jump(piece, to, via):
-                    directions[to] = via
+        occupied = self.get_occupied()
+        opponent = self.get_pieces(piece.get_opponent_player())
+        for via, to in JUMP_TABLE[piece.player][piece.isKing()][square(piece.row, piece.col)]:
+            if opponent >> via & 1 and not occupied >> to & 1:
+                directions[(SQUARE_ROW[to], SQUARE_COL[to])] = (SQUARE_ROW[via], SQUARE_COL[via])
         return directions
 
     def within_boundries(self, row, col):
@@ -293,7 +602,18 @@ class Board:
         return True
 
     def get_piece(self, row, col):
-        return self.board[row][col]
+        if (row + col) % 2 == 0:
+            return None
+        bit = 1 << square(row, col)
+        if self.men[Player.BLACK] & bit:
+            return Piece(row, col, 'b')
+        if self.kings[Player.BLACK] & bit:
+            return Piece(row, col, 'B')
+        if self.men[Player.WHITE] & bit:
+            return Piece(row, col, 'w')
+        if self.kings[Player.WHITE] & bit:
+            return Piece(row, col, 'W')
+        return None
 
     def is_valid_jump(self, piece, to, via):
         if self.within_boundries(to[0], to[1]) and \
@@ -309,109 +629,859 @@ class Board:
         return False
 
 
-class Game:
+####################### Batch Evaluation ############################################
+# The evaluation of many positions at once with numpy. A batch is a (4, n) int64 array of
+# bitboard planes: white men, black men, white kings, black kings of every position. The
+# bitboard shifts above work on such arrays unchanged, so the features are computed the
+# same way as in Board, one plane operation for all positions instead of one per board.
+np = None
+_numpy_loaded = False
+
+
+# numpy, imported on first use so that importing the engine stays fast; None if missing
+def get_numpy():
+    global np, _numpy_loaded, _SQUARE_BITS, _ADVANCE_WEIGHTS, _BYTE_COUNTS
+    if not _numpy_loaded:
+        _numpy_loaded = True
+        try:
+            import numpy
+        except ImportError:  # no batch evaluation, positions are evaluated one at a time
+            return None
+        np = numpy
+        _SQUARE_BITS = np.arange(32, dtype=np.int64)
+        _ADVANCE_WEIGHTS = np.array(ADVANCE, dtype=np.int64)
+        _BYTE_COUNTS = np.array([popcount(b) for b in range(256)], dtype=np.int64)
+    return np
+
+
+def batch_popcount(planes):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(planes).astype(np.int64)
+    return (_BYTE_COUNTS[planes & 0xFF] + _BYTE_COUNTS[(planes >> 8) & 0xFF] +
+            _BYTE_COUNTS[(planes >> 16) & 0xFF] + _BYTE_COUNTS[planes >> 24])
+
+
+# batch of the positions given as Board objects or (white men, black men, white kings, black kings)
+def stack_boards(boards):
+    get_numpy()
+    return np.array([board if isinstance(board, tuple) else
+                     (board.men[0], board.men[1], board.kings[0], board.kings[1])
+                     for board in boards], dtype=np.int64).reshape(-1, 4).T
+
+
+# Board.count_jumps for every position of the batch
+def batch_count_jumps(men, kings, player, empty):
+    opponent = men[1 - player] | kings[1 - player]
+    count = 0
+    jumpers = 0
+    for step, back, forward in DIRECTIONS:
+        pieces = kings[player] | men[player] if forward == player else kings[player]
+        sources = back(back(empty) & opponent) & pieces
+        count = count + batch_popcount(sources)
+        jumpers = jumpers | sources
+    return count, jumpers
+
+
+# Board.get_evaluation(player, player) of every position, as an int64 array; noise as
+# in get_evaluation, drawn for all positions at once unless noise is False
+def batch_evaluation(planes, player, noise=True):
+    get_numpy()
+    men = (planes[0], planes[1])
+    kings = (planes[2], planes[3])
+    opponent = opponent_of(player)
+    pieces = (men[0] | kings[0], men[1] | kings[1])
+    occupied = pieces[0] | pieces[1]
+    empty = ~occupied & FULL_MASK
+    left = (batch_popcount(pieces[0]), batch_popcount(pieces[1]))
+
+    # get_board_pieces_valuation
+    (edge_weight, opponent_jumps_weight, no_jump_weight, blocked_weight, jumps_weight,
+     pieces_weight, material_weight, kings_weight) = PIECE_WEIGHTS
+    result = batch_popcount(occupied & EDGE_MASK) * edge_weight
+    jumps, jumpers = batch_count_jumps(men, kings, opponent, empty)
+    result += jumps * opponent_jumps_weight
+    result += (left[opponent] - batch_popcount(jumpers)) * no_jump_weight
+    movers = 0
+    for step, back, forward in DIRECTIONS:
+        movers = movers | (back(empty) & (pieces[opponent] if forward == opponent else kings[opponent]))
+    result += (left[opponent] - batch_popcount(movers)) * blocked_weight
+    result += batch_count_jumps(men, kings, player, empty)[0] * jumps_weight
+    result += (left[0] + left[1]) * pieces_weight + (left[player] - left[opponent]) * material_weight
+    result += (batch_popcount(kings[player]) - batch_popcount(kings[opponent])) * kings_weight
+
+    # king_row_dist
+    advancement = ((men[player][:, None] >> _SQUARE_BITS) & 1) @ _ADVANCE_WEIGHTS[player]
+    result += np.where(left[player] > 0, advancement // np.maximum(left[player], 1), 0)
+    if noise:
+        global _batch_noise_rng
+        if _batch_noise_rng is None:
+            _batch_noise_rng = np.random.default_rng(_noise_seed)
+        result += _batch_noise_rng.integers(1, 6, len(result))
+    return result
+
+
+####################### Evaluation Weights ##########################################
+# replace some or all of EVAL_WEIGHTS; weights are rounded to integers so that scores stay
+# integers. Boards keep the king_row_dist terms they were set up with, so this is done
+# before any position is loaded.
+def set_eval_weights(weights):
+    global PIECE_WEIGHTS, _ADVANCE_WEIGHTS
+    for name, weight in weights.items():
+        if name not in EVAL_WEIGHTS:
+            raise ValueError("unknown evaluation weight " + repr(name))
+        EVAL_WEIGHTS[name] = int(round(weight))
+    PIECE_WEIGHTS = tuple(EVAL_WEIGHTS[name] for name in PIECE_WEIGHT_NAMES)
+    # in place, so that modules which imported ADVANCE see the new rows too
+    ADVANCE[:] = advance_table(EVAL_WEIGHTS["advance"], EVAL_WEIGHTS["near_promotion"])
+    if np is not None:
+        _ADVANCE_WEIGHTS = np.array(ADVANCE, dtype=np.int64)
+
+
+# weights written by tune_eval.py, a JSON object of feature name to weight; the defaults
+# stay when there is no such file
+def load_eval_weights(path=EVAL_WEIGHTS_FILE):
+    if os.path.isfile(path):
+        with open(path) as f:
+            set_eval_weights(json.load(f))
+
+
+load_eval_weights()
+
+
+####################### Endgame Database ############################################
+# Win/loss/draw of every position with few pieces, built offline by build_endgame_db.py.
+# Positions are grouped in slices by material (black men, black kings, white men, white
+# kings). Inside a slice the index combines the combinatorial rank of each group's squares
+# (men only over the 28 squares they can stand on) with the side to move. There is one byte
+# per position, seen from the side to move: 0 draw, 1-127 win in that many plies,
+# 128 + n loss in n plies.
+ENDGAME_MAGIC = b"CKEG"
+ENDGAME_VERSION = 1
+ENDGAME_HEADER = struct.Struct("<4sHHI")  # magic, version, max pieces, number of slices
+ENDGAME_SLICE = struct.Struct("<4BQQ")    # material, offset of its bytes, number of bytes
+ENDGAME_LOSS = 128
+ENDGAME_MAX_DISTANCE = 127
+ENDGAME_WIN_SCORE = 10000
+ENDGAME_WIN_BOUND = ENDGAME_WIN_SCORE - 1000  # scores at least this far from 0 are won or lost
+BINOMIAL = [[0] * 33 for _n in range(33)]
+for _n in range(33):
+    BINOMIAL[_n][0] = 1
+    for _k in range(1, _n + 1):
+        BINOMIAL[_n][_k] = BINOMIAL[_n - 1][_k - 1] + BINOMIAL[_n - 1][_k]
+MEN_SQUARE_OFFSET = [4, 0]  # white men never stand on row 0, black men never on row 7
+
+
+def combination_rank(bb, offset):
+    rank = 0
+    i = 1
+    while bb:
+        low = bb & -bb
+        rank += BINOMIAL[low.bit_length() - 1 - offset][i]
+        i += 1
+        bb ^= low
+    return rank
+
+
+def combination_unrank(rank, count, offset):
+    bb = 0
+    for i in range(count, 0, -1):
+        c = i - 1
+        while BINOMIAL[c + 1][i] <= rank:
+            c += 1
+        rank -= BINOMIAL[c][i]
+        bb |= 1 << (c + offset)
+    return bb
+
+
+def endgame_material(board):
+    return (popcount(board.men[Player.BLACK]), popcount(board.kings[Player.BLACK]),
+            popcount(board.men[Player.WHITE]), popcount(board.kings[Player.WHITE]))
+
+
+def endgame_slice_size(material):
+    bm, bk, wm, wk = material
+    return BINOMIAL[28][bm] * BINOMIAL[32][bk] * BINOMIAL[28][wm] * BINOMIAL[32][wk] * 2
+
+
+def endgame_index(material, men, kings, player):
+    index = combination_rank(men[Player.BLACK], MEN_SQUARE_OFFSET[Player.BLACK])
+    index = index * BINOMIAL[32][material[1]] + combination_rank(kings[Player.BLACK], 0)
+    index = index * BINOMIAL[28][material[2]] + combination_rank(men[Player.WHITE], MEN_SQUARE_OFFSET[Player.WHITE])
+    index = index * BINOMIAL[32][material[3]] + combination_rank(kings[Player.WHITE], 0)
+    return index * 2 + player
+
+
+# (men, kings, player to move) of an index, the inverse of endgame_index
+def endgame_position(material, index):
+    bm, bk, wm, wk = material
+    player = index & 1
+    index >>= 1
+    index, rank = divmod(index, BINOMIAL[32][wk])
+    white_kings = combination_unrank(rank, wk, 0)
+    index, rank = divmod(index, BINOMIAL[28][wm])
+    white_men = combination_unrank(rank, wm, MEN_SQUARE_OFFSET[Player.WHITE])
+    index, rank = divmod(index, BINOMIAL[32][bk])
+    black_kings = combination_unrank(rank, bk, 0)
+    black_men = combination_unrank(index, bm, MEN_SQUARE_OFFSET[Player.BLACK])
+    return [white_men, black_men], [white_kings, black_kings], player
+
+
+# search score of a stored byte: quicker wins and slower losses score better
+def endgame_score(value):
+    if value == 0:
+        return 0
+    if value < ENDGAME_LOSS:
+        return ENDGAME_WIN_SCORE - value
+    return -ENDGAME_WIN_SCORE + (value - ENDGAME_LOSS)
+
+
+# search score of a finished game for player to move, ply moves from the root: the side
+# without pieces has lost
+def game_over_score(board, player, ply):
+    if board.get_pieces(player):
+        return ENDGAME_WIN_SCORE - ply
+    return -ENDGAME_WIN_SCORE + ply
+
+
+# Read-only view of a database file. The file is memory-mapped, so opening it only
+# reads the slice directory and every probe touches a single byte.
+class EndgameDatabase:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.max_pieces, count = ENDGAME_HEADER.unpack_from(self.data, 0)
+        if magic != ENDGAME_MAGIC or version != ENDGAME_VERSION:
+            raise ValueError("not an endgame database: " + path)
+        self.slices = {}
+        for i in range(count):
+            bm, bk, wm, wk, offset, size = ENDGAME_SLICE.unpack_from(
+                self.data, ENDGAME_HEADER.size + i * ENDGAME_SLICE.size)
+            self.slices[(bm, bk, wm, wk)] = offset
+
+    # stored byte of the position with player to move, None when its material is not covered
+    def probe(self, board, player):
+        material = endgame_material(board)
+        offset = self.slices.get(material)
+        if offset is None:
+            return None
+        return self.data[offset + endgame_index(material, board.men, board.kings, player)]
+
+
+_endgame_db = None
+_endgame_db_loaded = False
+
+
+# the database next to this file, opened on first use; None when it was not built
+def get_endgame_db():
+    global _endgame_db, _endgame_db_loaded
+    if not _endgame_db_loaded:
+        _endgame_db_loaded = True
+        if os.path.isfile(ENDGAME_DB_FILE):
+            _endgame_db = EndgameDatabase(ENDGAME_DB_FILE)
+    return _endgame_db
+
+
+####################### Opening Book ################################################
+# Candidate moves for positions of the opening, built offline by build_opening_book.py
+# from self-play or imported games. After the header come fixed-size records sorted by
+# position key (Board.get_key of the side to move): key, from square, to square, weight.
+BOOK_MAGIC = b"CKOB"
+BOOK_VERSION = 1
+BOOK_HEADER = struct.Struct("<4sHI")  # magic, version, number of records
+BOOK_RECORD = struct.Struct("<QBBH")
+
+
+# Read-only view of a book file; memory-mapped and searched by bisection on the keys
+class OpeningBook:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size = BOOK_HEADER.unpack_from(self.data, 0)
+        if magic != BOOK_MAGIC or version != BOOK_VERSION:
+            raise ValueError("not an opening book: " + path)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        return BOOK_RECORD.unpack_from(self.data, BOOK_HEADER.size + i * BOOK_RECORD.size)[0]
+
+    # [(from square, to square, weight)] stored for the key
+    def probe(self, key):
+        candidates = []
+        i = bisect.bisect_left(self, key)
+        while i < self.size:
+            record = BOOK_RECORD.unpack_from(self.data, BOOK_HEADER.size + i * BOOK_RECORD.size)
+            if record[0] != key:
+                break
+            candidates.append(record[1:])
+            i += 1
+        return candidates
+
+
+_opening_book = None
+_opening_book_loaded = False
+
+
+# the book next to this file, opened on first use; None when it was not built
+def get_opening_book():
+    global _opening_book, _opening_book_loaded
+    if not _opening_book_loaded:
+        _opening_book_loaded = True
+        if os.path.isfile(OPENING_BOOK_FILE):
+            _opening_book = OpeningBook(OPENING_BOOK_FILE)
+    return _opening_book
+
+
+class Bound:
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+
+# The search counts won and lost scores in plies from the root, the table (and the endgame
+# database) from the position itself, so that they stay right wherever it is met again.
+def score_to_table(score, ply):
+    if score >= ENDGAME_WIN_BOUND:
+        return score + ply
+    if score <= -ENDGAME_WIN_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    if score >= ENDGAME_WIN_BOUND:
+        return score - ply
+    if score <= -ENDGAME_WIN_BOUND:
+        return score + ply
+    return score
+
+
+# Fixed-size transposition table. Every bucket has two slots: the first keeps the
+# deepest entry of the current search, the second is always replaced. Entries are
+# (key, depth, score, bound, best move, generation) with the score seen from the
+# side to move.
+class TranspositionTable:
+    ENTRY_BYTES = 160  # rough size of one entry tuple with its key and score objects
+
+    def __init__(self, size_mb=TT_SIZE_MB):
+        buckets = 1
+        while buckets * 4 * self.ENTRY_BYTES <= size_mb * 1024 * 1024:
+            buckets *= 2
+        self.mask = buckets - 1
+        self.table = [None] * (buckets * 2)
+        self.generation = 0
+        self.snapshot = None  # TableSnapshot of an earlier run, consulted on a miss
+
+    def new_search(self):
+        self.generation += 1
+
+    def clear(self):
+        self.table = [None] * len(self.table)
+        self.snapshot = None
+
+    def probe(self, key):
+        i = (key & self.mask) << 1
+        entry = self.table[i]
+        if entry is not None and entry[0] == key:
+            return entry
+        entry = self.table[i + 1]
+        if entry is not None and entry[0] == key:
+            return entry
+        if self.snapshot is not None:
+            return self.snapshot.probe(key)
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        i = (key & self.mask) << 1
+        entry = self.table[i]
+        if entry is None or entry[0] == key or depth >= entry[1] or entry[5] != self.generation:
+            self.table[i] = (key, depth, score, bound, move, self.generation)
+        else:
+            self.table[i + 1] = (key, depth, score, bound, move, self.generation)
+
+
+# Snapshot of the most valuable transposition table entries, written by driver() after
+# every move and memory-mapped by the next run so that it starts with the earlier searches'
+# results. Slots are open-addressed by key, probed at most TT_SNAPSHOT_PROBES from
+# key & (slots - 1), so a lookup reads a few records and the file is never decoded as a
+# whole. The header holds the side the scores were searched for and a checksum of the
+# evaluation weights, since the table's scores depend on both: a file that does not match
+# or is truncated is ignored. Records: key, score, depth (0 for an empty slot), bound, age
+# in moves, from square and the path of the best move, padded with 255 (from 255: no
+# move), and a CRC32 of these fields, checked when the record is read, so that a damaged
+# record is skipped without reading the whole file up front.
+TT_SNAPSHOT_MAGIC = b"CKTT"
+TT_SNAPSHOT_VERSION = 3
+TT_SNAPSHOT_HEADER = struct.Struct("<4sHHII")  # magic, version, player, weights checksum, slots
+TT_SNAPSHOT_FIELDS = struct.Struct("<QiBBBB8s")
+TT_SNAPSHOT_RECORD = struct.Struct("<QiBBBB8sI")  # the fields and their CRC32
+TT_SNAPSHOT_PROBES = 4
+TT_SNAPSHOT_NO_SQUARE = 255
+
+
+def eval_weights_checksum():
+    return zlib.crc32(json.dumps(EVAL_WEIGHTS, sort_keys=True).encode())
+
+
+# captured squares of a move given by its from square and path
+def jumped_squares(frm, path):
+    captured = []
+    for to in path:
+        if abs(SQUARE_ROW[to] - SQUARE_ROW[frm]) == 2:
+            captured.append(square((SQUARE_ROW[to] + SQUARE_ROW[frm]) // 2, (SQUARE_COL[to] + SQUARE_COL[frm]) // 2))
+        frm = to
+    return tuple(captured)
+
+
+class TableSnapshot:
+    def __init__(self, path, player):
+        if os.path.getsize(path) < TT_SNAPSHOT_HEADER.size:
+            raise ValueError("truncated transposition table snapshot: " + path)
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, stored_player, weights, self.slots = TT_SNAPSHOT_HEADER.unpack_from(self.data, 0)
+        if magic != TT_SNAPSHOT_MAGIC or version != TT_SNAPSHOT_VERSION or stored_player != player or \
+           weights != eval_weights_checksum() or self.slots & (self.slots - 1) or \
+           len(self.data) != TT_SNAPSHOT_HEADER.size + self.slots * TT_SNAPSHOT_RECORD.size:
+            self.close()
+            raise ValueError("unusable transposition table snapshot: " + path)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    # the snapshot of path for player's searches, None when there is none that fits
+    @staticmethod
+    def open(path, player):
+        try:
+            return TableSnapshot(path, player)
+        except (OSError, ValueError):
+            return None
+
+    # fields of the record in slot, None when its CRC32 does not match
+    def record(self, slot):
+        offset = TT_SNAPSHOT_HEADER.size + slot * TT_SNAPSHOT_RECORD.size
+        record = TT_SNAPSHOT_RECORD.unpack_from(self.data, offset)
+        if zlib.crc32(self.data[offset:offset + TT_SNAPSHOT_FIELDS.size]) != record[-1]:
+            return None
+        return record[:-1]
+
+    # entry like TranspositionTable.probe's, with generation -1, or None
+    def probe(self, key):
+        slot = key & (self.slots - 1)
+        for i in range(TT_SNAPSHOT_PROBES):
+            record = self.record((slot + i) & (self.slots - 1))
+            if record is None:
+                continue
+            if record[2] == 0:
+                return None
+            if record[0] == key:
+                return self.entry(record)
+        return None
+
+    @staticmethod
+    def entry(record):
+        key, score, depth, bound, age, frm, path = record
+        move = None
+        if frm != TT_SNAPSHOT_NO_SQUARE:
+            path = tuple(sq for sq in bytearray(path) if sq != TT_SNAPSHOT_NO_SQUARE)
+            move = (frm, path, jumped_squares(frm, path))
+        return key, depth, score, bound, move, -1
+
+    # (entry, age) of every stored record
+    def entries(self):
+        for slot in range(self.slots):
+            record = self.record(slot)
+            if record is not None and record[2] != 0:
+                yield self.entry(record), record[4]
+
+
+# bytes of a snapshot record holding fields
+def pack_snapshot_record(*fields):
+    packed = TT_SNAPSHOT_FIELDS.pack(*fields)
+    return packed + struct.pack("<I", zlib.crc32(packed))
+
+
+# write the deepest entries of table (and those of its snapshot not yet too old) to path
+# for player's next search; replaces the file only once the new one is complete
+def save_table_snapshot(table, path, player, size=TT_SNAPSHOT_ENTRIES):
+    candidates = {}
+    if table.snapshot is not None:
+        for entry, age in table.snapshot.entries():
+            if age < TT_SNAPSHOT_MAX_AGE:
+                candidates[entry[0]] = (entry, age + 1)
+    for entry in table.table:
+        if entry is not None and isinstance(entry[2], int) and -2 ** 31 <= entry[2] < 2 ** 31:
+            candidates[entry[0]] = (entry, 0)
+    chosen = sorted(candidates.values(), key=lambda item: item[0][1] - item[1], reverse=True)[:size]
+
+    slots = 1
+    while slots < 2 * len(chosen):
+        slots *= 2
+    records = [None] * slots
+    for (key, depth, score, bound, move, generation), age in chosen:
+        frm, squares = TT_SNAPSHOT_NO_SQUARE, b""
+        if move is not None and len(move[1]) <= 8:
+            frm, squares = move[0], bytes(move[1])
+        for i in range(TT_SNAPSHOT_PROBES):
+            slot = (key + i) & (slots - 1)
+            if records[slot] is None:
+                records[slot] = pack_snapshot_record(key, score, min(depth, 255), bound, age, frm,
+                                                     squares.ljust(8, bytes([TT_SNAPSHOT_NO_SQUARE])))
+                break
+    empty = pack_snapshot_record(0, 0, 0, 0, 0, TT_SNAPSHOT_NO_SQUARE, bytes([TT_SNAPSHOT_NO_SQUARE]) * 8)
+    body = b"".join(record if record is not None else empty for record in records)
+
+    temporary = path + ".tmp"
+    with open(temporary, 'wb') as f:
+        f.write(TT_SNAPSHOT_HEADER.pack(TT_SNAPSHOT_MAGIC, TT_SNAPSHOT_VERSION, player, eval_weights_checksum(),
+                                        slots))
+        f.write(body)
+    if table.snapshot is not None:
+        table.snapshot.close()
+        table.snapshot = None
+    os.replace(temporary, path)
+
+
+# Scores moves before they are searched: the hash/PV move first, then jumps by the number
+# of pieces and kings they take, promotions, the two killer moves of the ply and finally
+# the history score of the (from, to) squares. Game.move_orderer can be replaced, or set to
+# None to search in generation order, to measure what ordering saves in nodes.
+class MoveOrderer:
+    HASH_MOVE = 1 << 30
+    CAPTURE = 1 << 24
+    CAPTURED_PIECE = 1 << 21
+    CAPTURED_KING = 1 << 20
+    PROMOTION = 1 << 19
+    KILLER = 1 << 18
+    HISTORY_LIMIT = 1 << 17
+
     def __init__(self):
+        self.killers = []
+        self.history = [[0] * 32 for sq in range(32)]
+
+    def new_search(self):
+        self.killers = []
+        self.age_history()
+
+    def age_history(self):
+        for row in self.history:
+            for to in range(32):
+                row[to] >>= 1
+
+    def order(self, board, moves, player, ply, hash_move):
+        if len(moves) < 2:
+            return moves
+        killers = self.killers[ply] if ply < len(self.killers) else (None, None)
+        history = self.history
+        men = board.men[player]
+        opponent_kings = board.kings[1 - player]
+        promotion = PROMOTION_ROW[player]
+
+        def score(move):
+            if move == hash_move:
+                return self.HASH_MOVE
+            frm, path, captured = move
+            to = path[-1]
+            value = 0
+            if men >> frm & 1 and promotion >> to & 1:
+                value += self.PROMOTION
+            if captured:
+                value += self.CAPTURE + len(captured) * self.CAPTURED_PIECE
+                for sq in captured:
+                    if opponent_kings >> sq & 1:
+                        value += self.CAPTURED_KING
+                return value
+            if move == killers[0]:
+                return value + self.KILLER + 1
+            if move == killers[1]:
+                return value + self.KILLER
+            return value + history[frm][to]
+
+        moves.sort(key=score, reverse=True)
+        return moves
+
+    # a move caused a beta cutoff at depth plies from the horizon
+    def record_cutoff(self, move, depth, ply):
+        if move[2]:
+            return  # jumps are already ordered by what they take
+        while len(self.killers) <= ply:
+            self.killers.append([None, None])
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        row = self.history[move[0]]
+        row[move[1][-1]] += depth * depth
+        if row[move[1][-1]] >= self.HISTORY_LIMIT:
+            self.age_history()
+
+
+# Decides between iterative-deepening iterations whether the next depth can finish.
+# It keeps the elapsed time and node count of every completed iteration, predicts the
+# next one from the effective branching factor, allows more time while the best move
+# keeps changing and stops early once the same move has come back several times.
+# soft_deadline is the target from update_allowed_move_time; the search itself is only
+# aborted at hard_deadline.
+class TimeManager:
+    MAX_EXTENSION = 2.0          # hard budget as a multiple of the soft one
+    MAX_TIME_FRACTION = 0.25     # ... but never more than this share of the remaining time
+    INSTABILITY_EXTENSION = 1.5  # soft budget multiplier right after the best move changed
+    STABLE_ITERATIONS = 3        # same best move this many times in a row ...
+    STABLE_FRACTION = 0.3        # ... and this share of the soft budget used: stop
+    DEFAULT_BRANCHING = 4.0
+
+    def __init__(self, start_time, soft_deadline, remaining_time):
+        budget = soft_deadline - start_time
+        self.start_time = start_time
+        self.soft_deadline = soft_deadline
+        self.hard_deadline = start_time + min(budget * self.MAX_EXTENSION,
+                                              max(budget, remaining_time * self.MAX_TIME_FRACTION))
+        self.iterations = []  # (depth, elapsed, nodes, best move)
+        self.iteration_start = start_time
+        self.stable = 0
+
+    def start_iteration(self):
+        self.iteration_start = time.time()
+
+    def end_iteration(self, depth, nodes, best_move):
+        if self.iterations and self.iterations[-1][3] == best_move:
+            self.stable += 1
+        else:
+            self.stable = 0
+        self.iterations.append((depth, time.time() - self.iteration_start, nodes, best_move))
+
+    def branching_factor(self):
+        if len(self.iterations) < 2 or self.iterations[-2][2] == 0:
+            return self.DEFAULT_BRANCHING
+        ebf = self.iterations[-1][2] / self.iterations[-2][2]
+        return min(max(ebf, 1.5), 10.0)
+
+    def predict_next(self):
+        if not self.iterations:
+            return 0
+        return self.iterations[-1][1] * self.branching_factor()
+
+    def should_start_next(self):
+        now = time.time()
+        budget = self.soft_deadline - self.start_time
+        if self.stable + 1 >= self.STABLE_ITERATIONS and now - self.start_time >= budget * self.STABLE_FRACTION:
+            return False
+        target = self.soft_deadline
+        if len(self.iterations) > 1 and self.stable == 0:
+            target = min(self.start_time + budget * self.INSTABILITY_EXTENSION, self.hard_deadline)
+        return now + self.predict_next() <= target
+
+
+####################### Search Statistics ###########################################
+# Opt-in record of every search, written as one JSON line per move. While a search runs
+# the collector wraps the game's move generator, the board's push/pop and evaluation, the
+# table probe and the orderer's cutoff hook in instance attributes that count and time the
+# calls, and takes them away afterwards; with statistics off (Game.stats None) the search
+# runs the plain methods and pays nothing. Searches in worker processes are not counted.
+class SearchStats:
+    def __init__(self, sink):
+        self.sink = sink
+
+    def start(self, game):
+        self.started = time.time()
+        self.counts = {"evals": 0, "tt_hits": 0, "tt_misses": 0, "cutoffs": 0}
+        self.times = {"movegen": 0.0, "eval": 0.0, "make_unmake": 0.0}
+        self.iterations = []
+        self.patched = []
+        self.active = set()
+        board = game.gameBoard
+        self._time(game, "get_all_moves", "movegen")
+        self._time(game, "get_jump_sequences", "movegen")
+        self._time(board, "get_evaluation", "eval", "evals")
+        self._time(board, "push", "make_unmake")
+        self._time(board, "pop", "make_unmake")
+        probe = game.tt.probe
+        counts = self.counts
+
+        def counted_probe(key):
+            entry = probe(key)
+            counts["tt_hits" if entry is not None else "tt_misses"] += 1
+            return entry
+        self._patch(game.tt, "probe", counted_probe)
+        if game.move_orderer is not None:
+            record_cutoff = game.move_orderer.record_cutoff
+
+            def counted_cutoff(move, depth, ply):
+                counts["cutoffs"] += 1
+                record_cutoff(move, depth, ply)
+            self._patch(game.move_orderer, "record_cutoff", counted_cutoff)
+
+    def _patch(self, obj, name, function):
+        setattr(obj, name, function)
+        self.patched.append((obj, name))
+
+    # time the calls of obj.name under the timer key, counting them under count if given;
+    # calls made from inside another timed call of the same key are not timed twice
+    def _time(self, obj, name, key, count=None):
+        method = getattr(obj, name)
+        times = self.times
+        counts = self.counts
+        active = self.active
+
+        def timed(*args):
+            if count is not None:
+                counts[count] += 1
+            if key in active:
+                return method(*args)
+            active.add(key)
+            t = time.perf_counter()
+            try:
+                return method(*args)
+            finally:
+                times[key] += time.perf_counter() - t
+                active.discard(key)
+        self._patch(obj, name, timed)
+
+    def end_iteration(self, game, depth):
+        previous = self.iterations[-1]["nodes"] if self.iterations else 0
+        elapsed, nodes = game.time_manager.iterations[-1][1:3]
+        self.iterations.append({"depth": depth, "nodes": nodes, "time": round(elapsed, 4),
+                                "ebf": round(nodes / previous, 2) if previous else None,
+                                "cutoffs": self.counts["cutoffs"],
+                                "tt_hits": self.counts["tt_hits"],
+                                "best": game.format_move(game.pv_move).replace("\n", " ")})
+
+    def finish(self, game, move, source):
+        for obj, name in self.patched:
+            delattr(obj, name)
+        self.patched = []
+        now = time.time()
+        hard = game.time_manager.hard_deadline if game.time_manager is not None else game.allowed_time
+        record = {
+            "side": "BLACK" if game.turn == Player.BLACK else "WHITE",
+            "move": game.format_move(move).replace("\n", " "),
+            "source": source,
+            "pieces": popcount(game.gameBoard.get_occupied()),
+            "elapsed": round(now - game.start_time, 4),
+            "remaining_time": game.remaining_time,
+            "allowed_time": round(hard - game.start_time, 4),
+            "time_left_at_end": round(hard - now, 4),
+            "timed_out": game.TimeLimitExceeded,
+            "nodes": game.nodes,
+            "pv": [game.format_move(m).replace("\n", " ") for m in game.pv] if source == "search" else [],
+            "iterations": self.iterations,
+        }
+        record.update(self.counts)
+        for key, value in self.times.items():
+            record[key + "_time"] = round(value, 4)
+        self.sink.write(json.dumps(record) + "\n")
+        self.sink.flush()
+
+
+_stats_sink = None
+
+
+# send the statistics of every Game created from now on to path ("-" for stderr, None: off)
+def set_stats_file(path):
+    global _stats_sink
+    if path is None:
+        _stats_sink = None
+    elif path == "-":
+        _stats_sink = sys.stderr
+    else:
+        _stats_sink = open(path, 'a')
+
+
+class Game:
+    # tt and move_orderer may be handed over from an earlier Game to keep their contents
+    def __init__(self, tt=None, move_orderer=None):
         self.gameType = GameType.SINGLE
         self.turn = Player.BLACK
         self.remaining_time = 100
         self.gameBoard = Board()
-        self.min_depth = 3
+        self.min_depth = 3  # starting values of get_best_move's depth ladder
         self.max_depth = 6
         self.TimeLimitExceeded = False
         self.allowed_time = 3
         self.start_time = 0
-
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.move_orderer = move_orderer if move_orderer is not None else MoveOrderer()
+        self.pv_move = None  # best move of the last completed iteration
+        self.pv = []         # its principal variation
+        self.root_player = self.turn  # side the leaves are evaluated for
+        self.nodes = 0
+        self.workers = SEARCH_WORKERS
+        self.depth_limit = None  # deepest iteration when set, in place of the depth ladder's, as the clock allows
+        self.use_quiescence = True  # resolve pending jumps below the nominal depth
+        self.use_lmr = LATE_MOVE_REDUCTIONS
+        self.use_futility = FUTILITY_PRUNING
+        self.use_extensions = SEARCH_EXTENSIONS
+        self.search_depth = 0  # nominal depth of the running iteration, extensions stop at twice it
+        self.batch_eval = BATCH_EVAL and get_numpy() is not None
+        if _stats_sink is None and STATS_FILE is not None:
+            set_stats_file(STATS_FILE)
+        self.stats = SearchStats(_stats_sink) if _stats_sink is not None else None
+        self.time_manager = None
+        self.root_best_move = None  # best root move of the running iteration so far
+        self.root_pv_done = False   # the running iteration has finished searching pv_move
+        self.best_score = None      # root score of the last completed iteration, root player's view
+        self.depth_reached = 0      # depth of the last completed iteration
+        self.move_source = None     # how get_best_move found its move: search, forced, endgame, none
+        self.ponder_hit = None      # (depth, score, pv) searched for this position while pondering
+        self.endgame_db = get_endgame_db()
+
+    # Moves are (from square, path of landing squares, captured squares) tuples; the
+    # search applies them in place with Board.push and reverts them with Board.pop.
     # jump sequence for a player
     def get_jump_sequences(self, board, player):
         jump_sequences = []
-        for piece in board.get_all_pieces(player):
-            # print("Getting jump sequences")
-            # get possible jumps of piece
-            possible_jumps = self.get_all_possible_jumps(board, piece, piece)
-            # print("possible jumps : ",possible_jumps)
-            # board.print_board()
-            if possible_jumps is not None:
-                for jump in possible_jumps:
-                    jump_sequences.append(jump)
+        opponent = board.get_pieces(1 - player)
+        empty = ~board.get_occupied() & FULL_MASK
+        kings = board.kings[player]
+        for sq in iter_squares(board.get_jumpers(player)):
+            if kings >> sq & 1:
+                jumps, promotion = JUMP_TABLE[player][1], 0
+            else:
+                jumps, promotion = JUMP_TABLE[player][0], PROMOTION_ROW[player]
+            self.get_all_possible_jumps(jumps, promotion, sq, sq, opponent, empty, (), (), jump_sequences)
         return jump_sequences
 
-    # jump sequence for a piece
-    def get_all_possible_jumps(self, board, piece, from_piece, jumps=[], skipped=[]):
-        moves = []
-        flag = False
-        directions = board.get_jump_directions(piece)
-        if len(directions) > 0:
-            flag = False
-            # print("Directions: ",directions)
-            for to, via in directions.items():
-                temp_board = deepcopy(board)
-                temp_piece = temp_board.get_piece(piece.row, piece.col)
-                # print(to, via)
-                # piece, move, board, captured_pieces
-                flag = temp_piece.isKing()
-                temp_board = self.play_move(temp_piece, to, temp_board, [temp_board.get_piece(via[0], via[1])])
-                # get double or multijumps of piece
-                # If piece is converted to king so end the move
-                if not flag and temp_piece.isKing():
-                    #  print("Flag1")
-                    flag = True
-                    moves.append((temp_board, jumps+[to], skipped+[via], from_piece))
-                    return moves
-                j = self.get_all_possible_jumps(temp_board, temp_piece,  from_piece, jumps+[to], skipped+[via])
-                # print(j)
-                if j:
-                    moves = moves + j
-        elif jumps:
-            moves.append((board, jumps, skipped, from_piece))
-            return moves
-
-        return moves
+    # jump sequence for a piece, followed on bitboards without touching the board;
+    # jumps is the JUMP_TABLE row of the piece and promotion its king row (0 for kings)
+    def get_all_possible_jumps(self, jumps, promotion, origin, sq, opponent, empty, path, captured, moves):
+        found = False
+        for via, to in jumps[sq]:
+            if not (opponent >> via & 1 and empty >> to & 1):
+                continue
+            found = True
+            # If piece is converted to king so end the move
+            if promotion >> to & 1:
+                moves.append((origin, path + (to,), captured + (via,)))
+                continue
+            # get double or multijumps of piece
+            self.get_all_possible_jumps(jumps, promotion, origin, to, opponent ^ (1 << via),
+                                        (empty | (1 << sq) | (1 << via)) ^ (1 << to),
+                                        path + (to,), captured + (via,), moves)
+        if not found and path:
+            moves.append((origin, path, captured))
 
     def get_diagonal_moves(self, board, player):
-        # print("Get dignoal moves for player : ", player)
         moves = []
-        for piece in board.get_all_pieces(player):
-            directions = board.get_diagonal_directions(piece)
-            if directions:
-                for to in directions:
-                    temp_board = deepcopy(board)
-                    temp_piece = temp_board.get_piece(piece.row, piece.col)
-                    temp_board = self.play_move(temp_piece, to, temp_board, [])
-                    moves.append((temp_board, [to], [], piece))
+        occupied = board.get_occupied()
+        kings = board.kings[player]
+        for sq in iter_squares(board.get_movers(player)):
+            for to in MOVE_TABLE[player][kings >> sq & 1][sq]:
+                if not occupied >> to & 1:
+                    moves.append((sq, (to,), ()))
         return moves
 
     # if jump moves are not availbale then get normal diagonal moves
     def get_all_moves(self, board, player, both=False):
-        # print("[get_all_moves] Get all moves for player :", player)
         all_jumps = self.get_jump_sequences(board, player)
         if all_jumps and not both:
-            # print("[get_all_moves] Printing jump moves")
-            # for j in all_jumps:
-                # print("Jump : ", j)
             return all_jumps
-        # print("[get_all_moves] No jump sequence found.")
         diagonal_moves = self.get_diagonal_moves(board, player)
-        if diagonal_moves and not both:
-            # print("[get_all_moves] Diagonal moves: ")
-            # for m in diagonal_moves:
-            #     print(m)
+        if not both:
             return diagonal_moves
-        if both:
-            # print("[get_all_moves]")
-            if all_jumps and not diagonal_moves:
-                return all_jumps
-            if not all_jumps and diagonal_moves:
-                return diagonal_moves
-            all_jumps.extend(diagonal_moves)
-            return all_jumps
-
-    # just move the piece to destination
-    def play_move(self, piece, move, board, captured_pieces):
-        # print("play_move:")
-        board.make_move(piece, move[0], move[1])
-        if captured_pieces:
-            board.remove_captured_pieces(captured_pieces)
-        return board
+        all_jumps.extend(diagonal_moves)
+        return all_jumps
 
     def print_game_data(self):
         print("Game Type     :", self.gameType)
@@ -445,68 +1515,222 @@ class Game:
 
     def play(self):
         # returns J FROM_POS TO_POS format tuples
+        return self.format_move(self.get_best_move())
+
+    # search the position and return the chosen (from, path, captured) move
+    def get_best_move(self):
+        if self.stats is not None:
+            self.stats.start(self)
         best_move = None
+        source = "search"
+        self.best_score = None
+        self.depth_reached = 0
         # if only one jump available then take that move 
         all_moves = self.get_all_moves(self.gameBoard, self.turn)
         # print("[play] length of moves: ", all_moves)
         if len(all_moves) == 1:
             best_move = all_moves[0]
+            source = "forced"
         elif len(all_moves) == 0:
-            print("No moves available")
+            print("No moves available", file=sys.stderr)  # stdout is the daemon's reply channel
+            source = "none"
         else:
+            best_move = self.get_endgame_move(all_moves)
+            if best_move is not None:
+                source = "endgame"
+        if best_move is None and len(all_moves) > 1:
             best_move = all_moves[0]
             self.TimeLimitExceeded = False
-
-            if (self.gameBoard.black_left + self.gameBoard.white_left) >= 15:
-                self.min_depth = 3
-                self.max_depth = 7
-
-            if (self.gameBoard.black_left + self.gameBoard.white_left) <= 10:
-                self.min_depth +=1
-                self.max_depth +=1
+            self.tt.new_search()
+            if self.move_orderer is not None:
+                self.move_orderer.new_search()
+            self.pv_move = None
+            self.pv = []
+            self.root_player = self.turn
+            self.nodes = 0
+
+            # the depth ladder starts from the game's min_depth and max_depth on every move
+            pieces = self.gameBoard.black_left + self.gameBoard.white_left
+            min_depth, max_depth = self.min_depth, self.max_depth
+            if pieces >= 15:
+                min_depth = 3
+                max_depth = 7
+
+            if pieces <= 10:
+                min_depth +=1
+                max_depth +=1
 
             if self.allowed_time - self.start_time < 3:
-                self.min_depth = 2
-                self.max_depth = 4
+                min_depth = 2
+                max_depth = 4
 
             if self.allowed_time - self.start_time < 10:
-                self.min_depth = 2
-                self.max_depth = 6
-
-            if (self.gameBoard.black_left + self.gameBoard.white_left) <= 5:
-                self.min_depth +=1
-                self.max_depth +=1
-
-            # print("[play] Min Depth  :", self.min_depth)
-            # print("[play] Max Depth  :", self.max_depth)
-            for depth in range(self.min_depth, self.max_depth):
+                min_depth = 2
+                max_depth = 6
+
+            if pieces <= 5:
+                min_depth +=1
+                max_depth +=1
+
+            # the selective search finishes its iterations sooner, the time manager decides
+            # whether the extra ones fit
+            if self.use_lmr or self.use_futility:
+                max_depth += SELECTIVE_EXTRA_DEPTH
+
+            if self.depth_limit is not None:
+                min_depth = min(min_depth, self.depth_limit)
+                max_depth = self.depth_limit + 1
+
+            # print("[play] Min Depth  :", min_depth)
+            # print("[play] Max Depth  :", max_depth)
+            # from here on allowed_time is the hard deadline the search aborts at
+            self.time_manager = TimeManager(self.start_time, self.allowed_time, self.remaining_time)
+            self.allowed_time = self.time_manager.hard_deadline
+            first_depth = min_depth
+            if self.ponder_hit is not None and self.ponder_hit[2][0] in all_moves:
+                # the iterations finished while pondering need not be searched again
+                self.depth_reached, self.best_score, self.pv = self.ponder_hit
+                best_move = self.pv_move = self.pv[0]
+                first_depth = max(min_depth, self.depth_reached + 1)
+            for depth in range(first_depth, max_depth):
                 # print("For depth:", depth)
                 # there is less than second remaining 
                 if self.allowed_time - self.start_time < 0.3:
                     break
 
-                move = self.minimax(self.gameBoard, depth, float('-inf'), float('inf'), self.turn, self.turn)[1]
-
-                if not self.TimeLimitExceeded and move:
+                self.time_manager.start_iteration()
+                iteration_nodes = self.nodes
+                if self.workers > 1:
+                    self.root_best_move = None
+                    self.root_pv_done = False
+                    score, pv = self.parallel_search(all_moves, depth, depth == min_depth)
+                else:
+                    score, pv = self.aspiration_search(depth)
 
+                if not self.TimeLimitExceeded and pv:
+                    move = pv[0]
                     best_move = move
+                    self.pv_move = move
+                    self.pv = pv
+                    self.best_score = score
+                    self.depth_reached = depth
+                    self.time_manager.end_iteration(depth, self.nodes - iteration_nodes, move)
+                    if self.stats is not None:
+                        self.stats.end_iteration(self, depth)
 
                 elif self.TimeLimitExceeded:
+                    # keep what the aborted depth proved: its best move once the old pv was refuted
+                    if self.root_best_move is not None and (self.root_pv_done or self.pv_move is None):
+                        best_move = self.root_best_move
                     break
-                t = time.time() + (self.allowed_time - self.start_time)/2
-                if t >= self.allowed_time:
+                if not self.time_manager.should_start_next():
                     # print("[play] : Ooopz.. Cannot run next depth within time Depth: ", depth)
-                    self.TimeLimitExceeded = True
                     break
         # print("[play] print best move: ", best_move)
-        # print("[play] print best move board")
-        # best_move[0].print_board()
-        from_pos = (best_move[3].row, best_move[3].col) # self.get_from_position(best_move)
-        res = self.map_moves(from_pos, best_move[1], best_move[2])
-        # print("[play] move:\n", res)
-        # print("[play] print original board")
-        # self.gameBoard.print_board()
-        return res
+        self.move_source = source
+        if self.stats is not None:
+            self.stats.finish(self, best_move, source)
+        return best_move
+
+    # Search the position with no deadline, one iteration after the other, until stopped from
+    # another thread by setting allowed_time to 0; the last completed iteration is kept in
+    # depth_reached, best_score and pv.
+    def ponder(self):
+        self.TimeLimitExceeded = False
+        self.tt.new_search()
+        if self.move_orderer is not None:
+            self.move_orderer.new_search()
+        self.pv_move = None
+        self.pv = []
+        self.best_score = None
+        self.depth_reached = 0
+        self.root_player = self.turn
+        self.nodes = 0
+        if len(self.get_all_moves(self.gameBoard, self.turn)) < 2:
+            return
+        for depth in range(1, PONDER_MAX_DEPTH + 1):
+            score, pv = self.aspiration_search(depth)
+            if self.TimeLimitExceeded or not pv:
+                return
+            self.pv_move = pv[0]
+            self.pv = pv
+            self.best_score = score
+            self.depth_reached = depth
+
+    # One root iteration: a window of ASPIRATION_WINDOW around the score of the previous
+    # iteration, widened fourfold on the side the score falls out of until it fits (a
+    # full window once it gets wide). Returns pvs's (score, principal variation).
+    def aspiration_search(self, depth):
+        inf = float('inf')
+        delta = ASPIRATION_WINDOW
+        if self.best_score is None or abs(self.best_score) >= ENDGAME_WIN_BOUND:
+            alpha, beta = -inf, inf
+        else:
+            alpha, beta = self.best_score - delta, self.best_score + delta
+        while True:
+            self.root_best_move = None
+            self.root_pv_done = False
+            self.search_depth = depth
+            score, pv = self.pvs(self.gameBoard, depth, alpha, beta, self.turn)
+            if self.TimeLimitExceeded or alpha < score < beta:
+                return score, pv
+            delta *= 4
+            if score <= alpha:
+                alpha = score - delta if delta < ASPIRATION_WINDOW * 64 else -inf
+            else:
+                beta = score + delta if delta < ASPIRATION_WINDOW * 64 else inf
+
+    # E/J notation of a (from, path, captured) move
+    def format_move(self, move):
+        if move is None:
+            return ""
+        frm, path, captured = move
+        from_pos = (SQUARE_ROW[frm], SQUARE_COL[frm])
+        return self.map_moves(from_pos, [(SQUARE_ROW[sq], SQUARE_COL[sq]) for sq in path], captured)
+
+    # perfect move from the endgame database, None if the position is not covered
+    def get_endgame_move(self, moves):
+        board = self.gameBoard
+        if self.endgame_db is None or popcount(board.get_occupied()) > self.endgame_db.max_pieces:
+            return None
+        opponent = opponent_of(self.turn)
+        best_move = None
+        best_score = None
+        for move in moves:
+            undo = board.push(move, self.turn)
+            if board.is_game_over():
+                score = ENDGAME_WIN_SCORE
+            else:
+                value = self.endgame_db.probe(board, opponent)
+                score = None if value is None else -endgame_score(value)
+            board.pop(undo)
+            if score is None:
+                return None
+            if best_score is None or score > best_score:
+                best_score = score
+                best_move = move
+        return best_move
+
+    # book move for the position, picked at random by weight; None if unknown
+    def get_book_move(self):
+        book = get_opening_book()
+        if book is None:
+            return None
+        candidates = book.probe(self.gameBoard.get_key(self.turn))
+        choices = []
+        total = 0
+        for move in self.get_all_moves(self.gameBoard, self.turn):
+            for frm, to, weight in candidates:
+                if move[0] == frm and move[1][-1] == to and weight > 0:
+                    choices.append((move, weight))
+                    total += weight
+        if not choices:
+            return None
+        pick = randint(1, total)
+        for move, weight in choices:
+            pick -= weight
+            if pick <= 0:
+                return move
 
     def get_opening_move(self, move_num):
         # print("[get_opening_move]: getting opening move")
@@ -537,141 +1761,664 @@ class Game:
     def create_board_from_input(self, boardState):
         self.gameBoard.create_board(boardState)
 
-    # minimax using alpha beta pruning
-    def minimax(self, board, depth, alpha, beta, maxPlayer, player):
-        if depth == 0 or board.is_game_over():
-            return board.get_evaluation(maxPlayer, player), board
-
-        if self.TimeLimitExceeded:
-            # print("[minimax] :  Time limit exceeded")
-            return 0, board
-
-        if self.allowed_time <= (time.time()):
-            # print("[minimax] : Ooopz.. Time limit exceeded depth: ", depth)
+    # Principal variation search in negamax form: scores are from the side to move, player.
+    # The first move is searched with the full (alpha, beta) window, the others with a null
+    # window that only tells whether they beat alpha, and are searched again with the full
+    # window when they do. Returns (score, principal variation as a list of moves). Leaves
+    # are scored from the root player's evaluation, Board.get_evaluation(player, root),
+    # negated for the opponent; children are visited by pushing the move on the board and
+    # popping it after. ply is the distance from the root, used by the move orderer.
+    def pvs(self, board, depth, alpha, beta, player, ply=0):
+        self.nodes += 1
+        if self.nodes & TIME_CHECK_MASK == 0 and self.allowed_time <= (time.time()):
+            # print("[pvs] : Ooopz.. Time limit exceeded depth: ", depth)
             self.TimeLimitExceeded = True
-            return 0 , board
 
-        if maxPlayer == player:
-            val = float('-inf')
-            best_move = None
-            for sequence in self.get_all_moves(board, player):
-                #print("Sequence", sequence)
-                jumped_board = sequence[0]
-                opponent = Player.WHITE if maxPlayer == Player.BLACK else Player.BLACK
-                tmp = self.minimax(jumped_board, depth-1, alpha, beta, opponent, player)[0]
-                if self.TimeLimitExceeded:
-                    # print("[minimax] : max player Time limit exceeded")
-                    return 0, board
-                val = max(val, tmp)
-                if val == tmp:
-                    best_move = sequence
-                alpha = max(alpha, val)
+        if self.TimeLimitExceeded:
+            return 0, []
+
+        if ply > 0 and self.endgame_db is not None and \
+           popcount(board.get_occupied()) <= self.endgame_db.max_pieces:
+            value = self.endgame_db.probe(board, player)
+            if value is not None:
+                return score_from_table(endgame_score(value), ply), []
+
+        if board.is_game_over():
+            # the side left without pieces has lost, like a blocked one
+            return game_over_score(board, player, ply), []
+        if depth == 0:
+            if self.use_quiescence:
+                return self.quiescence(board, alpha, beta, player, ply), []
+            return board.get_evaluation(player, self.root_player), []
+
+        # table scores are kept from the side to move, like the search's, under a key of
+        # the root player too
+        key = board.get_key(player, self.root_player)
+        tt_move = None
+        entry = self.tt.probe(key)
+        if entry is not None:
+            tt_move = entry[4]
+            if entry[1] >= depth and ply > 0:
+                score = score_from_table(entry[2], ply)
+                bound = entry[3]
+                if bound == Bound.EXACT:
+                    return score, [tt_move] if tt_move is not None else []
+                if bound == Bound.LOWER:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
                 if beta <= alpha:
-                    break
-            return val, best_move
+                    return score, [tt_move] if tt_move is not None else []
+
+        moves = self.get_all_moves(board, player)
+        if not moves:
+            # blocked: the side to move has lost
+            return -ENDGAME_WIN_SCORE + ply, []
+        if self.move_orderer is not None:
+            hash_move = self.pv_move if ply == 0 and self.pv_move is not None else tt_move
+            moves = self.move_orderer.order(board, moves, player, ply, hash_move)
+
+        alpha_orig = alpha
+        opponent = opponent_of(player)
+        # extension: a forced reply or a capture costs no depth, up to twice the nominal length
+        new_depth = depth - 1
+        if self.use_extensions and (len(moves) == 1 or moves[0][2]) and ply + depth < 2 * self.search_depth:
+            new_depth = depth
+        # futility: near the leaves, quiet moves cannot lift a static evaluation this far below alpha
+        futile = False
+        if self.use_futility and ply > 0 and depth < len(FUTILITY_MARGINS) and new_depth < depth and \
+           beta - alpha == 1 and not moves[0][2]:
+            futility_score = board.get_evaluation(player, self.root_player) + FUTILITY_MARGINS[depth]
+            futile = futility_score <= alpha
+        pruned = False
+        leaf_scores = None
+        if new_depth == 0 and self.batch_eval and len(moves) >= BATCH_MIN_POSITIONS:
+            leaf_scores = self.evaluate_children(board, moves, player)
+        best = float('-inf')
+        best_move = None
+        pv = []
+        for i, move in enumerate(moves):
+            # neither a capture nor the promotion of a man
+            quiet = not move[2] and not (board.men[player] >> move[0] & 1 and
+                                         PROMOTION_ROW[player] >> move[1][-1] & 1)
+            if futile and i > 0 and quiet:
+                pruned = True
+                continue
+            if leaf_scores is not None and leaf_scores[i] is not None:
+                score, child_pv = leaf_scores[i], []
+            else:
+                undo = board.push(move, player)
+                if i == 0:
+                    score, child_pv = self.pvs(board, new_depth, -beta, -alpha, opponent, ply+1)
+                    score = -score
+                else:
+                    # late move reduction: a quiet move far down the order is tried a ply
+                    # shallower first and searched again at full depth if it beats alpha
+                    reduced = self.use_lmr and quiet and i >= LMR_FIRST_MOVE and depth >= LMR_MIN_DEPTH and \
+                        ply > 0 and new_depth < depth
+                    score, child_pv = self.pvs(board, new_depth - reduced, -alpha-1, -alpha, opponent, ply+1)
+                    score = -score
+                    if reduced and score > alpha and not self.TimeLimitExceeded:
+                        score, child_pv = self.pvs(board, new_depth, -alpha-1, -alpha, opponent, ply+1)
+                        score = -score
+                    if alpha < score < beta and not self.TimeLimitExceeded:
+                        score, child_pv = self.pvs(board, new_depth, -beta, -alpha, opponent, ply+1)
+                        score = -score
+                board.pop(undo)
+            if self.TimeLimitExceeded:
+                # print("[pvs] : Time limit exceeded")
+                return 0, []
+            if score > best:
+                best = score
+                best_move = move
+                pv = [move] + child_pv
+                # after a fail low every root score is only an upper bound, no proof of a better move
+                if ply == 0 and score > alpha_orig:
+                    self.root_best_move = move
+            if ply == 0 and move == self.pv_move:
+                self.root_pv_done = True
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                if self.move_orderer is not None:
+                    self.move_orderer.record_cutoff(move, depth, ply)
+                break
+
+        # a pruned move is only known to score no more than the static evaluation plus the margin
+        if pruned:
+            best = max(best, futility_score)
+        if best <= alpha_orig:
+            bound = Bound.UPPER
+        elif best >= beta:
+            bound = Bound.LOWER
         else:
-            # for min player 
-            val = float('inf')
-            best_move = None
-            for sequence in self.get_all_moves(board, player):
-                jumped_board = sequence[0]
-
-                opponent = Player.WHITE if maxPlayer == Player.BLACK else Player.BLACK
-                tmp = self.minimax(jumped_board, depth-1, alpha, beta,  opponent, player)[0]
-                if self.TimeLimitExceeded:
-                    # print("[minimax] : min player Time limit exceeded")
-                    return 0, board
-                val = min(beta, tmp)
-                if val == tmp:
-                    best_move = sequence
-                beta = min (beta, val )
-                if beta <= alpha:
-                    break
-            return val, best_move
+            bound = Bound.EXACT
+        self.tt.store(key, depth, score_to_table(best, ply), bound, best_move)
+        return best, pv
+
+    # Scores, for the side to move, of the children of a depth-1 node that pvs would evaluate
+    # statically, found with one batch_evaluation; None for the children that need a search
+    # of their own (game over, endgame database position, jump pending for the quiescence).
+    def evaluate_children(self, board, moves, player):
+        opponent = opponent_of(player)
+        scores = [None] * len(moves)
+        quiet = []
+        children = []
+        for i, move in enumerate(moves):
+            undo = board.push(move, player)
+            if not board.is_game_over() and \
+               (self.endgame_db is None or popcount(board.get_occupied()) > self.endgame_db.max_pieces) and \
+               not (self.use_quiescence and board.get_jumpers(opponent)):
+                quiet.append(i)
+                children.append((board.men[0], board.men[1], board.kings[0], board.kings[1]))
+            board.pop(undo)
+        if children:
+            self.nodes += len(children)
+            sign = 1 if player == self.root_player else -1
+            for i, score in zip(quiet, batch_evaluation(stack_boards(children), self.root_player).tolist()):
+                scores[i] = score * sign
+        return scores
+
+    # Quiescence search: below the nominal depth only the jumps are followed, until the side
+    # to move has none left. Jumps are compulsory, so there is no standing pat while one is
+    # pending; the static evaluation (the stand-pat score) is returned once it is quiet.
+    # Negamax form like pvs.
+    def quiescence(self, board, alpha, beta, player, ply):
+        self.nodes += 1
+        if self.nodes & TIME_CHECK_MASK == 0 and self.allowed_time <= (time.time()):
+            self.TimeLimitExceeded = True
+        if self.TimeLimitExceeded:
+            return 0
+
+        if board.is_game_over():
+            return game_over_score(board, player, ply)
+        if not board.get_jumpers(player):
+            return board.get_evaluation(player, self.root_player)
+
+        opponent = opponent_of(player)
+        best = float('-inf')
+        for move in self.get_jump_sequences(board, player):
+            undo = board.push(move, player)
+            best = max(best, -self.quiescence(board, -beta, -alpha, opponent, ply+1))
+            board.pop(undo)
+            alpha = max(alpha, best)
+            if self.TimeLimitExceeded or alpha >= beta:
+                break
+        return best
+
+    # Root splitting: the ordered root moves are dealt round-robin to the worker processes,
+    # each searches its share to depth with its own warm tables and reports its best line.
+    # Returns (score, principal variation) like pvs; no line, with TimeLimitExceeded set,
+    # when a share does not finish in time.
+    def parallel_search(self, moves, depth, new_search):
+        moves = moves[:]
+        if self.move_orderer is not None:
+            moves = self.move_orderer.order(self.gameBoard, moves, self.turn, 0, self.pv_move)
+        # the workers search with this game's switches, not their defaults
+        settings = (self.use_quiescence, self.use_lmr, self.use_futility, self.use_extensions,
+                    self.endgame_db is not None, self.move_orderer is not None)
+        tasks = []
+        for i in range(min(self.workers, len(moves))):
+            tasks.append((self.gameBoard, moves[i::self.workers], self.turn, depth, self.allowed_time, new_search,
+                          settings))
+        import multiprocessing
+        result = get_search_pool(self.workers).map_async(_search_root_moves, tasks)
+        try:
+            results = result.get(max(self.allowed_time - time.time(), 0) + 0.1)
+        except multiprocessing.TimeoutError:
+            self.TimeLimitExceeded = True
+            return 0, []
+
+        best_score = float('-inf')
+        best_pv = []
+        for score, pv, nodes in results:
+            self.nodes += nodes
+            if not pv:
+                self.TimeLimitExceeded = True
+                return 0, []
+            if not best_pv or score > best_score:
+                best_score = score
+                best_pv = pv
+        return best_score, best_pv
+
+
+####################### Search Workers ##############################################
+_search_pool = None
+_search_pool_size = 0
+_worker_game = None
+_worker_move_orderer = None
+
+
+# process pool kept for the life of the interpreter so later moves skip the startup
+def get_search_pool(workers):
+    global _search_pool, _search_pool_size
+    if _search_pool is None or _search_pool_size != workers:
+        if _search_pool is not None:
+            _search_pool.terminate()
+        import multiprocessing
+        _search_pool = multiprocessing.Pool(workers, initializer=_init_search_worker)
+        _search_pool_size = workers
+    return _search_pool
+
+
+def _init_search_worker():
+    global _worker_game, _worker_move_orderer
+    _worker_game = Game()
+    _worker_move_orderer = _worker_game.move_orderer
+
+
+# search a share of the root moves, returns (best score, its principal variation, nodes)
+# or (None, [], nodes) if the deadline passed first
+def _search_root_moves(task):
+    board, moves, player, depth, deadline, new_search, settings = task
+    quiescence, lmr, futility, extensions, endgame, ordering = settings
+    game = _worker_game
+    game.use_quiescence = quiescence
+    game.use_lmr = lmr
+    game.use_futility = futility
+    game.use_extensions = extensions
+    game.endgame_db = get_endgame_db() if endgame else None
+    game.move_orderer = _worker_move_orderer if ordering else None
+    game.gameBoard = board
+    game.allowed_time = deadline
+    game.TimeLimitExceeded = False
+    game.nodes = 0
+    game.root_player = player
+    game.search_depth = depth
+    if new_search:
+        game.tt.new_search()
+        if game.move_orderer is not None:
+            game.move_orderer.new_search()
+
+    opponent = opponent_of(player)
+    alpha = float('-inf')
+    best_pv = []
+    for move in moves:
+        undo = board.push(move, player)
+        score, pv = game.pvs(board, depth - 1, float('-inf'), -alpha, opponent, 1)
+        board.pop(undo)
+        if game.TimeLimitExceeded:
+            return None, [], game.nodes
+        if not best_pv or -score > alpha:
+            alpha = -score
+            best_pv = [move] + pv
+    return alpha, best_pv, game.nodes
+
+
+####################### Engine API ##################################################
+# Library entry point for harnesses and services: no files are read or written and the
+# tables (transposition table, history) stay warm between the calls of one Engine.
+#
+#   engine = Engine()
+#   result = engine.best_move(rows, "BLACK", 2.0, {"depth": 6})
+#   result.notation, result.score, result.pv
+#
+# position is the board as 8 strings (or lists) in the input.txt format, side the player to
+# move (Player.BLACK/WHITE or "BLACK"/"WHITE") and time_budget the seconds for this move.
+# options: depth (deepest iteration), quiescence/endgame (False turns them off), book
+# (True consults the opening book first), workers (root splitting processes), lmr/futility/
+# extensions (True or False overrides the selective search defaults).
+class SearchResult:
+    def __init__(self, move, notation, score, pv, depth, nodes, source):
+        self.move = move          # (from square, path, captured), None when there is no move
+        self.notation = notation  # the move in E/J notation, as written to output.txt
+        self.score = score        # root score for the side to move, None unless searched
+        self.pv = pv              # principal variation, E/J notation of every move
+        self.depth = depth
+        self.nodes = nodes
+        self.source = source      # search, forced, endgame, book or none
 
-####################### Driver Function ##############################################
-def driver(start):
-    game = None
-    with open(INPUT_FILE, 'r') as f:
-        game = Game()
+    def __repr__(self):
+        return "SearchResult({!r}, score={}, depth={}, nodes={}, source={})".format(
+            self.notation, self.score, self.depth, self.nodes, self.source)
+
+
+class Engine:
+    def __init__(self, tt_size_mb=TT_SIZE_MB):
+        self.tt = TranspositionTable(tt_size_mb)
+        self.move_orderer = MoveOrderer()
+
+    def new_game(self):
+        self.tt.clear()
+        self.move_orderer = MoveOrderer()
+
+    def best_move(self, position, side, time_budget=3.0, options=None):
+        options = options or {}
+        game = Game(self.tt, self.move_orderer)
+        game.create_board_from_input([list(row) for row in position])
+        if side in ("BLACK", "WHITE"):
+            side = Player.BLACK if side == "BLACK" else Player.WHITE
+        game.turn = side
+        game.start_time = time.time()
+        game.remaining_time = time_budget
+        game.allowed_time = game.start_time + time_budget
+        game.depth_limit = options.get("depth")
+        game.use_quiescence = options.get("quiescence", True)
+        game.use_lmr = options.get("lmr", game.use_lmr)
+        game.use_futility = options.get("futility", game.use_futility)
+        game.use_extensions = options.get("extensions", game.use_extensions)
+        if not options.get("endgame", True):
+            game.endgame_db = None
+        game.workers = options.get("workers", game.workers)
+
+        if not game.get_all_moves(game.gameBoard, side):
+            return SearchResult(None, "", None, [], 0, 0, "none")
+        move = game.get_book_move() if options.get("book") else None
+        if move is not None:
+            return SearchResult(move, game.format_move(move), None, [game.format_move(move)], 0, 0, "book")
+        move = game.get_best_move()
+        pv = game.pv if game.move_source == "search" and game.pv and game.pv[0] == move else [move]
+        return SearchResult(move, game.format_move(move), game.best_score,
+                            [game.format_move(m) for m in pv], game.depth_reached, game.nodes, game.move_source)
+
+
+####################### Self-Play ###################################################
+# One engine game from rows for the tools that play the engine against itself. Each colour
+# keeps a transposition table and move orderer of its own, since their contents belong to
+# the side searched for, and searches every move with a fresh Game like
+# EngineDaemon.get_move, so nothing else carries over from one move to the next:
+#   new_game(player, tt, move_orderer) builds the Game of player's move around its tables
+#       (None on its first move)
+#   choose(game, ply) returns the move game.turn plays, or None to stop the game there
+# The moves of opening are played first, black moving first. Returns the winner, the side
+# whose opponent is left without a move, or None when choose stopped the game or it
+# reached max_plies.
+def self_play_game(new_game, choose, max_plies, opening=(), rows=START_POSITION):
+    board = Board()
+    board.create_board([list(row) for row in rows])
+    tables = {Player.BLACK: (None, None), Player.WHITE: (None, None)}
+    player = Player.BLACK
+    for move in opening:
+        board.push(move, player)
+        player = opponent_of(player)
+    for ply in range(max_plies):
+        game = new_game(player, *tables[player])
+        tables[player] = (game.tt, game.move_orderer)
+        game.gameBoard = board
+        game.turn = player
+        if not game.get_all_moves(board, player):
+            return opponent_of(player)
+        move = choose(game, ply)
+        if move is None:
+            return None
+        board.push(move, player)
+        player = opponent_of(player)
+    return None
 
-        if f.readline().rstrip() == "GAME":
-            game.gameType = GameType.GAME
-        else:
-            game.turn = GameType.SINGLE
 
-        if f.readline().rstrip() =="BLACK":
-            game.turn = Player.BLACK
-        else:
-            game.turn = Player.WHITE
+####################### Driver Function ##############################################
+# read a position in the input.txt format from a file object into game
+def read_input(f, game, start):
+    if f.readline().rstrip() == "GAME":
+        game.gameType = GameType.GAME
+    else:
+        game.turn = GameType.SINGLE
 
-        game.remaining_time = float(f.readline().rstrip())
-        # Read the Board state
-        game.start_time = start
-        game.update_allowed_move_time()
+    if f.readline().rstrip() =="BLACK":
+        game.turn = Player.BLACK
+    else:
+        game.turn = Player.WHITE
 
-        boardState = []
-        for i in range(8):
-            boardState.append(list(f.readline().rstrip()))
+    game.remaining_time = float(f.readline().rstrip())
+    # Read the Board state
+    game.start_time = start
+    game.update_allowed_move_time()
 
-        game.create_board_from_input(boardState)
-        # game.print_game_data()
-        f.close()
+    boardState = []
+    for i in range(8):
+        boardState.append(list(f.readline().rstrip()))
 
-    if os.path.isfile(OUTPUT_FILE):
-        f = open(OUTPUT_FILE, 'w')
-        f.truncate()
-    else:
-        f = open(OUTPUT_FILE, "w")
+    game.create_board_from_input(boardState)
+    # game.print_game_data()
 
-    # Get Moves of the player  E FROM_POS TO_POS  J FROM_POS TO_POS format
+
+# Get Moves of the player  E FROM_POS TO_POS  J FROM_POS TO_POS format
+def choose_move(game, moves_so_far):
     moves = None
-    if game.gameType == GameType.SINGLE:
-        moves = game.play()
+    if game.gameType == GameType.GAME and moves_so_far < BOOK_MOVES:
+        moves = game.format_move(game.get_book_move())
+    if not moves and game.gameType == GameType.GAME and moves_so_far < 1:
+        moves = game.get_opening_move(moves_so_far+1)
+    return moves or game.play()
+
+
+# the file based command line engine: one position from input_file, one move to output_file
+def driver(start, input_file=INPUT_FILE, output_file=OUTPUT_FILE, playdata_file=PLAYDATA_FILE,
+           snapshot_file=TT_SNAPSHOT_FILE):
+    game = Game()
+    with open(input_file, 'r') as f:
+        read_input(f, game, start)
+    # the snapshot is only of use to the next move of the same game
+    if game.gameType != GameType.GAME:
+        snapshot_file = None
+    if snapshot_file is not None:
+        game.tt.snapshot = TableSnapshot.open(snapshot_file, game.turn)
+
+    if os.path.isfile(output_file):
+        f = open(output_file, 'w')
+        f.truncate()
     else:
-        moves_so_far = 0
-        if os.path.isfile(PLAYDATA_FILE):
-            fs = open(PLAYDATA_FILE, 'r')
-            moves_so_far = int(fs.readline().rstrip())
-            fs.close()
-        # initial game
-        if moves_so_far < 1:
-            moves = game.get_opening_move(moves_so_far+1)
-
-            if os.path.isfile(PLAYDATA_FILE):
-                fs = open(PLAYDATA_FILE, 'w')
-                fs.truncate()
-            else:
-                fs = open(PLAYDATA_FILE, 'w')
-
-            fs.write(str(moves_so_far+1))
-            fs.close()
-
+        f = open(output_file, "w")
+
+    moves_so_far = 0
+    if game.gameType == GameType.GAME and os.path.isfile(playdata_file):
+        fs = open(playdata_file, 'r')
+        moves_so_far = int(fs.readline().rstrip())
+        fs.close()
+    moves = choose_move(game, moves_so_far)
+
+    # count the moves of the game so the opening book knows when to stop
+    if game.gameType == GameType.GAME:
+        if os.path.isfile(playdata_file):
+            fs = open(playdata_file, 'w')
+            fs.truncate()
         else:
-            moves = game.play()
+            fs = open(playdata_file, 'w')
+
+        fs.write(str(moves_so_far+1))
+        fs.close()
 
     f.write(moves)
     f.close()
+    # the move is out, the snapshot for the next run is no longer on the game's clock
+    if snapshot_file is not None:
+        save_table_snapshot(game.tt, snapshot_file, game.turn)
     return game.remaining_time
 
 
+####################### Pondering ###################################################
+# While the opponent thinks, the position after our move and the reply the principal
+# variation predicts is searched in a background thread with the same transposition
+# table and history. When the real position arrives the thread is stopped: if the
+# opponent played the predicted reply (a ponder hit) the real search starts from the
+# pondered iterations, otherwise it still profits from the warmed tables.
+class Ponderer:
+    def __init__(self):
+        self.game = None
+        self.thread = None
+        self.key = None
+
+    # ponder after game played its search's first pv move
+    def start(self, game):
+        self.stop()
+        if len(game.pv) < 2:
+            return
+        board = game.gameBoard.copy()
+        opponent = opponent_of(game.turn)
+        board.push(game.pv[0], game.turn)
+        board.push(game.pv[1], opponent)
+        ponder_game = Game(game.tt, game.move_orderer)
+        ponder_game.gameType = game.gameType
+        ponder_game.gameBoard = board
+        ponder_game.turn = game.turn
+        ponder_game.use_quiescence = game.use_quiescence
+        ponder_game.endgame_db = game.endgame_db
+        ponder_game.allowed_time = float('inf')
+        self.game = ponder_game
+        self.key = board.get_key(game.turn)
+        self.thread = threading.Thread(target=ponder_game.ponder)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # stop pondering; when game is the pondered position, hand the result over to it
+    def stop(self, game=None):
+        if self.thread is None:
+            return
+        self.game.allowed_time = 0
+        self.thread.join()
+        if game is not None and self.key == game.gameBoard.get_key(game.turn) and self.game.pv:
+            game.ponder_hit = (self.game.depth_reached, self.game.best_score, self.game.pv)
+        self.thread = None
+        self.game = None
+
+
+####################### Daemon ######################################################
+# Long running engine: positions arrive in the input.txt format (11 lines) and the move is
+# answered in E/J notation followed by an empty line. The transposition table, history,
+# worker pool and move counter stay warm between the moves of a game. A line NEWGAME
+# clears them; a position with more pieces than the previous one starts a new game too.
+# With ponder set, the engine keeps searching between the moves of a GAME (see Ponderer).
+class EngineDaemon:
+    def __init__(self, ponder=False):
+        self.tt = TranspositionTable()
+        self.move_orderer = MoveOrderer()
+        self.moves_so_far = 0
+        self.pieces_left = None
+        self.ponderer = Ponderer() if ponder else None
+
+    def new_game(self):
+        if self.ponderer is not None:
+            self.ponderer.stop()
+        self.tt.clear()
+        self.move_orderer = MoveOrderer()
+        self.moves_so_far = 0
+        self.pieces_left = None
+
+    def get_move(self, f):
+        start = time.time()
+        game = Game(self.tt, self.move_orderer)
+        read_input(f, game, start)
+        if self.ponderer is not None:
+            self.ponderer.stop(game)
+        pieces = game.gameBoard.black_left + game.gameBoard.white_left
+        if self.pieces_left is not None and pieces > self.pieces_left:
+            self.new_game()
+            game.move_orderer = self.move_orderer
+        self.pieces_left = pieces
+        moves = choose_move(game, self.moves_so_far)
+        if game.gameType == GameType.GAME:
+            self.moves_so_far += 1
+            if self.ponderer is not None and game.pv and moves == game.format_move(game.pv[0]):
+                self.ponderer.start(game)
+        return moves
+
+    # answer every position read from inp on out until end of input or QUIT
+    def serve(self, inp, out):
+        while True:
+            line = inp.readline()
+            if not line or line.strip() == "QUIT":
+                if self.ponderer is not None:
+                    self.ponderer.stop()
+                return
+            line = line.strip()
+            if not line:
+                continue
+            if line == "NEWGAME":
+                self.new_game()
+                continue
+            position = [line + "\n"] + [inp.readline() for i in range(10)]
+            out.write(self.get_move(_Lines(position)) + "\n\n")
+            out.flush()
+
+    # the file based flow kept running: the position in input_file is answered in
+    # output_file every time the file changes, until it has not changed for PONDER_IDLE_EXIT
+    def serve_files(self, input_file=INPUT_FILE, output_file=OUTPUT_FILE):
+        last = None
+        idle_since = time.time()
+        while time.time() - idle_since < PONDER_IDLE_EXIT:
+            try:
+                with open(input_file) as f:
+                    stamp = (os.stat(input_file).st_mtime_ns, f.read())
+            except OSError:
+                stamp = None
+            # a file still being written has fewer than its 11 lines
+            if stamp is not None and stamp != last and len(stamp[1].splitlines()) >= 11:
+                last = stamp
+                moves = self.get_move(_Lines(stamp[1].splitlines(True)))
+                with open(output_file, 'w') as f:
+                    f.write(moves)
+                idle_since = time.time()
+            time.sleep(0.01)
+        if self.ponderer is not None:
+            self.ponderer.stop()
+
+    def serve_socket(self, path):
+        import socket
+        if os.path.exists(path):
+            os.unlink(path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen(1)
+        try:
+            while True:
+                conn, addr = server.accept()
+                with conn, conn.makefile('r') as inp, conn.makefile('w') as out:
+                    self.serve(inp, out)
+        finally:
+            server.close()
+            os.unlink(path)
+
+
+# readline() over lines already read, so read_input can parse them
+class _Lines:
+    def __init__(self, lines):
+        self.lines = iter(lines)
+
+    def readline(self):
+        return next(self.lines, "")
+
+
 #######################  Calling Driver  ###########################################
 # All program calling
-start = time.time()
-# proces_s = time.process_time()
-# datetime_start = datetime.datetime.now()
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--daemon", action="store_true", help="keep running and answer positions from stdin")
+    parser.add_argument("--socket", help="with --daemon, listen on this Unix socket instead of stdin")
+    parser.add_argument("--ponder", action="store_true",
+                        help="think on the opponent's time; without --daemon keep answering input.txt when it changes")
+    parser.add_argument("--stats", help="append search statistics as JSON lines to this file, - for stderr")
+    parser.add_argument("--seed", type=int, help="seed of the evaluation noise, for reproducible runs")
+    args = parser.parse_args()
+    if args.stats:
+        set_stats_file(args.stats)
+    if args.seed is not None:
+        seed_noise(args.seed)
+    if args.ponder and not args.daemon:
+        EngineDaemon(ponder=True).serve_files()
+        sys.exit(0)
+    if args.daemon:
+        daemon = EngineDaemon(ponder=args.ponder)
+        if args.socket:
+            daemon.serve_socket(args.socket)
+        else:
+            daemon.serve(sys.stdin, sys.stdout)
+        sys.exit(0)
+
+    start = time.time()
+    # proces_s = time.process_time()
+    # datetime_start = datetime.datetime.now()
 
-t = driver(start)
+    t = driver(start)
 
-# end = time.time()
-# time_taken = (end - start)
-# print("Total time taken : " , time_taken)
-# print("Remaining time taken : " , t - time_taken)
+    # end = time.time()
+    # time_taken = (end - start)
+    # print("Total time taken : " , time_taken)
+    # print("Remaining time taken : " , t - time_taken)
 
 
-# process_e = time.process_time()
-# datetime_end  = datetime.datetime.now()
+    # process_e = time.process_time()
+    # datetime_end  = datetime.datetime.now()
 
-# datetime_time_taken = datetime_end - datetime_start
-# process_taken = process_e - proces_s
-# print("Process time taken : " , process_taken)
+    # datetime_time_taken = datetime_end - datetime_start
+    # process_taken = process_e - proces_s
+    # print("Process time taken : " , process_taken)
@@ -0,0 +1,242 @@
+# Server hosting many games at once over a Unix or TCP socket, sharing one bounded pool
+# of search processes.
+#
+#   python game_server.py --unix /tmp/checkers.sock --workers 4
+#   python game_server.py --tcp 127.0.0.1:8765
+#
+# Requests and replies are JSON lines; every reply echoes the request's "id" so that a
+# client may have requests for several games outstanding on one connection.
+#   {"op": "new_game", "type": "GAME", "side": "BLACK", "clock": 300}   -> {"game": "g1"}
+#   {"op": "move", "game": "g1", "position": [8 rows], "time": 291.5}  -> {"move": "E f6 e5", ...}
+#   {"op": "metrics", "game": "g1"}  (without game: every game and the totals)
+#   {"op": "end_game", "game": "g1"}
+# Each game keeps its own GameType, side, clock and history. The clock starts at "clock"
+# and loses the time from receiving a move request to answering it; a "time" in the
+# request sets it, like the remaining time line of input.txt. Search jobs wait in one
+# queue per game and are handed to the pool round-robin over the games, so a busy game
+# cannot starve the others. A job's time is counted from its arrival, so the time spent
+# waiting for a free process is taken from that game's budget and its deadline holds.
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import itertools
+import json
+import time
+
+from checker_ai_bot import Game, GameType, Player, TranspositionTable, MoveOrderer, choose_move
+
+_tt = None
+_move_orderers = None  # one per side, the killers and history of one side do not fit the other's
+
+
+def _init_worker():
+    global _tt, _move_orderers
+    _tt = TranspositionTable()
+    _move_orderers = {Player.BLACK: MoveOrderer(), Player.WHITE: MoveOrderer()}
+
+
+# runs in a pool process: (move in E/J notation, search seconds, nodes, depth)
+def _search(job):
+    rows, side, game_type, remaining_time, arrival, moves_so_far = job
+    game = Game(_tt, _move_orderers[side])
+    game.gameType = game_type
+    game.turn = side
+    game.remaining_time = remaining_time
+    game.start_time = arrival
+    game.update_allowed_move_time()
+    game.create_board_from_input([list(row) for row in rows])
+    start = time.time()
+    move = choose_move(game, moves_so_far)
+    return move, time.time() - start, game.nodes, game.depth_reached
+
+
+class ServerGame:
+    def __init__(self, game_type, side, clock):
+        self.game_type = game_type
+        self.side = side
+        self.remaining_time = clock
+        self.history = []  # (position received, move answered)
+        self.latencies = []  # seconds from request to reply
+        self.waits = []  # seconds spent queued for a search process
+        self.nodes = 0
+        self.search_time = 0.0
+
+    def metrics(self):
+        result = summary(self.latencies)
+        result.update({"moves": len(self.history), "remaining_time": round(self.remaining_time, 3),
+                       "queue_wait": summary(self.waits), "nodes": self.nodes,
+                       "nodes_per_second": round(self.nodes / self.search_time) if self.search_time else 0})
+        return result
+
+
+# count, mean, median, 95th percentile and maximum of a list of seconds
+def summary(values):
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    return {"count": len(ordered), "mean": round(sum(ordered) / len(ordered), 4),
+            "p50": round(ordered[len(ordered) // 2], 4),
+            "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+            "max": round(ordered[-1], 4)}
+
+
+# Round-robin dispatch of search jobs to a process pool with a fixed number of slots
+class Scheduler:
+    def __init__(self, workers):
+        self.executor = concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker)
+        self.slots = asyncio.Semaphore(workers)
+        self.queues = collections.defaultdict(collections.deque)
+        self.ready = collections.deque()  # games with queued jobs, in turn order
+        self.wake = asyncio.Event()
+        self.running = 0
+
+    async def submit(self, game_id, job):
+        future = asyncio.get_running_loop().create_future()
+        self.queues[game_id].append((job, future, time.time()))
+        if game_id not in self.ready:
+            self.ready.append(game_id)
+        self.wake.set()
+        return await future
+
+    def queued(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    async def run(self):
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            while self.ready:
+                await self.slots.acquire()
+                game_id = self.ready.popleft()
+                job, future, queued_at = self.queues[game_id].popleft()
+                if self.queues[game_id]:
+                    self.ready.append(game_id)
+                else:
+                    del self.queues[game_id]
+                asyncio.ensure_future(self.execute(job, future, time.time() - queued_at))
+
+    async def execute(self, job, future, wait):
+        self.running += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, _search, job)
+            if not future.cancelled():
+                future.set_result((result, wait))
+        except Exception as e:
+            if not future.cancelled():
+                future.set_exception(e)
+        finally:
+            self.running -= 1
+            self.slots.release()
+
+
+class GameServer:
+    def __init__(self, workers):
+        self.workers = workers
+        self.games = {}
+        self.ended = []  # metrics of the finished games, kept for the totals
+        self.ids = itertools.count(1)
+        self.scheduler = None
+
+    async def start(self):
+        self.scheduler = Scheduler(self.workers)
+        asyncio.ensure_future(self.scheduler.run())
+
+    async def handle_connection(self, reader, writer):
+        pending = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.ensure_future(self.reply(line, writer))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.wait(pending)
+        finally:
+            writer.close()
+
+    async def reply(self, line, writer):
+        request = {}
+        try:
+            request = json.loads(line)
+            response = await self.handle(request)
+        except Exception as e:
+            response = {"error": "{}: {}".format(type(e).__name__, e)}
+        response["id"] = request.get("id") if isinstance(request, dict) else None
+        writer.write((json.dumps(response) + "\n").encode())
+        await writer.drain()
+
+    async def handle(self, request):
+        op = request.get("op")
+        if op == "new_game":
+            game_id = request.get("game") or "g{}".format(next(self.ids))
+            game_type = GameType.SINGLE if request.get("type") == "SINGLE" else GameType.GAME
+            side = Player.WHITE if request.get("side") == "WHITE" else Player.BLACK
+            self.games[game_id] = ServerGame(game_type, side, float(request.get("clock", 300)))
+            return {"game": game_id}
+        if op == "move":
+            return await self.move(request["game"], request)
+        if op == "metrics":
+            if "game" in request:
+                return self.games[request["game"]].metrics()
+            return self.metrics()
+        if op == "end_game":
+            game = self.games.pop(request["game"])
+            self.ended.append(game)
+            return game.metrics()
+        raise ValueError("unknown op {!r}".format(op))
+
+    async def move(self, game_id, request):
+        game = self.games[game_id]
+        arrival = time.time()
+        if "time" in request:
+            game.remaining_time = float(request["time"])
+        moves_so_far = len(game.history)
+        job = (request["position"], game.side, game.game_type, game.remaining_time, arrival, moves_so_far)
+        (move, search_time, nodes, depth), wait = await self.scheduler.submit(game_id, job)
+        latency = time.time() - arrival
+        game.remaining_time -= latency
+        game.history.append((request["position"], move))
+        game.latencies.append(latency)
+        game.waits.append(wait)
+        game.nodes += nodes
+        game.search_time += search_time
+        return {"move": move, "depth": depth, "nodes": nodes, "latency": round(latency, 4),
+                "queue_wait": round(wait, 4), "remaining_time": round(game.remaining_time, 3)}
+
+    def metrics(self):
+        games = list(self.games.values()) + self.ended
+        latencies = [latency for game in games for latency in game.latencies]
+        waits = [wait for game in games for wait in game.waits]
+        nodes = sum(game.nodes for game in games)
+        search_time = sum(game.search_time for game in games)
+        total = summary(latencies)
+        total.update({"games": len(self.games), "finished_games": len(self.ended),
+                      "queue_wait": summary(waits), "queued": self.scheduler.queued(),
+                      "searching": self.scheduler.running,
+                      "nodes_per_second": round(nodes / search_time) if search_time else 0})
+        return {"games": {game_id: game.metrics() for game_id, game in self.games.items()}, "total": total}
+
+
+async def serve(args):
+    server = GameServer(args.workers)
+    await server.start()
+    if args.unix:
+        listener = await asyncio.start_unix_server(server.handle_connection, path=args.unix)
+    else:
+        host, port = args.tcp.rsplit(":", 1)
+        listener = await asyncio.start_server(server.handle_connection, host, int(port))
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == "__main__":
+    import multiprocessing
+    parser = argparse.ArgumentParser(description="serve many checkers games over a socket")
+    parser.add_argument("--unix", help="Unix socket path")
+    parser.add_argument("--tcp", default="127.0.0.1:8765", help="host:port when no Unix socket is given")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="search processes")
+    asyncio.run(serve(parser.parse_args()))
@@ -0,0 +1,137 @@
+# Move generator check and benchmark: counts the leaves of the move tree of a position
+# down to a fixed depth and compares them with known counts.
+#
+#   python perft.py                          # reference suite, up to depth 6
+#   python perft.py --depth 8 --position start
+#   python perft.py --input input.txt --depth 5 --divide
+#
+# With bulk counting (the default) the moves of the last ply are counted without being
+# made, which is how the engine's own throughput is usually quoted; --no-bulk makes and
+# unmakes every leaf move as well, to time Board.push/Board.pop too.
+import argparse
+import sys
+import time
+
+from checker_ai_bot import (Game, Player, COL_MAP, ROW_MAP, SQUARE_ROW, SQUARE_COL, START_POSITION, read_input,
+                            opponent_of)
+
+# name, board rows as in input.txt, side to move, leaf counts from depth 1 on
+PERFT_SUITE = [
+    ("start", START_POSITION, Player.BLACK,
+     [7, 49, 302, 1469, 7361, 36768, 179740, 845931]),
+    # a triple jump and a double jump sharing the first capture
+    ("multi-jump", ["........", "..b.....", "...w.w..", "........",
+                    "...w.w..", "b.......", "...w...w", "w.w....."], Player.BLACK,
+     [2, 9, 20, 75, 224, 1197, 3200]),
+    # both jumps reach the last row and must stop there although the new king could go on
+    ("promotion-jump", ["....w...", "........", ".....w..", "........",
+                        "........", "..b.b...", "...w.w..", "........"], Player.BLACK,
+     [3, 6, 20, 72, 212, 685, 2742]),
+    # kings capturing in every direction, for both sides
+    ("black-king-captures", ["........", "..w.....", "...w.w..", "....B...",
+                             "...w.w..", "........", "...w...W", "........"], Player.BLACK,
+     [3, 21, 62, 583, 1338, 9546, 27784]),
+    ("white-king-captures", ["........", "b.b.....", "...b.b..", "....W...",
+                             "...b.b..", "........", ".....b..", "B......."], Player.WHITE,
+     [3, 31, 103, 887, 2396, 20443, 55731]),
+]
+
+
+def field_name(sq):
+    return COL_MAP[SQUARE_COL[sq]] + str(ROW_MAP[SQUARE_ROW[sq]])
+
+
+# move as "f6-e5", or "c3xe5xg7" for a jump
+def move_name(move):
+    frm, path, captured = move
+    separator = "x" if captured else "-"
+    return separator.join(field_name(sq) for sq in (frm,) + tuple(path))
+
+
+class Perft:
+    def __init__(self, bulk=True):
+        self.game = Game()
+        self.bulk = bulk
+        self.nodes = 0  # positions whose moves were generated
+
+    def count(self, board, player, depth):
+        moves = self.game.get_all_moves(board, player)
+        self.nodes += 1
+        if depth == 1 and self.bulk:
+            return len(moves)
+        leaves = 0
+        opponent = opponent_of(player)
+        for move in moves:
+            undo = board.push(move, player)
+            leaves += self.count(board, opponent, depth - 1) if depth > 1 else 1
+            board.pop(undo)
+        return leaves
+
+    # leaf count below every root move
+    def divide(self, board, player, depth):
+        result = []
+        for move in self.game.get_all_moves(board, player):
+            undo = board.push(move, player)
+            result.append((move, self.count(board, opponent_of(player), depth - 1) if depth > 1 else 1))
+            board.pop(undo)
+        return result
+
+
+def load_rows(game, rows):
+    game.create_board_from_input([list(row) for row in rows])
+
+
+# count every depth up to max_depth; False if a known count is not met
+def run_position(name, board, player, max_depth, counts, bulk):
+    ok = True
+    for depth in range(1, max_depth + 1):
+        perft = Perft(bulk)
+        start = time.time()
+        leaves = perft.count(board, player, depth)
+        elapsed = time.time() - start
+        expected = counts[depth - 1] if depth <= len(counts) else None
+        status = ""
+        if expected is not None:
+            status = "ok" if leaves == expected else "FAIL (expected {})".format(expected)
+            ok = ok and leaves == expected
+        print("{:<20} depth {} {:>10} leaves {:>8.3f}s {:>10.0f} nodes/s  {}".format(
+            name, depth, leaves, elapsed, perft.nodes / max(elapsed, 1e-9), status))
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="count move tree leaves to check and time the move generator")
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--position", help="run only this position of the reference suite")
+    parser.add_argument("--input", help="position file in the input.txt format instead of the suite")
+    parser.add_argument("--divide", action="store_true", help="print the leaf count below every root move")
+    parser.add_argument("--no-bulk", dest="bulk", action="store_false", help="make and unmake the leaf moves too")
+    args = parser.parse_args()
+
+    positions = []
+    if args.input:
+        game = Game()
+        with open(args.input) as f:
+            read_input(f, game, time.time())
+        positions.append((args.input, game, []))
+    else:
+        for name, rows, player, counts in PERFT_SUITE:
+            if args.position in (None, name):
+                game = Game()
+                load_rows(game, rows)
+                game.turn = player
+                positions.append((name, game, counts))
+        if not positions:
+            parser.error("unknown position " + args.position)
+
+    all_ok = True
+    for name, game, counts in positions:
+        if args.divide:
+            total = 0
+            for move, leaves in Perft(args.bulk).divide(game.gameBoard, game.turn, args.depth):
+                print("{:<16} {}".format(move_name(move), leaves))
+                total += leaves
+            print("{:<16} {}".format("total", total))
+        else:
+            all_ok = run_position(name, game.gameBoard, game.turn, args.depth, counts, args.bulk) and all_ok
+    sys.exit(0 if all_ok else 1)
@@ -0,0 +1,173 @@
+# Search quality benchmark: how fast the engine finds the known best move of a suite of
+# tactical and positional positions, compared with a stored baseline to catch regressions.
+#
+#   python search_bench.py                          # search_suite.txt at the default budgets
+#   python search_bench.py --time 0.5 --time 3 --position deep-1
+#   python search_bench.py --save-baseline          # after a change that is meant to stay
+#
+# The suite holds one block per position, blocks separated by empty lines: a "# name"
+# line, the 11 lines of input.txt (mode, side, time, 8 rows; mode and time are ignored)
+# and the expected output.txt, "E f6 e5" or the "J" lines of a jump. Blocks of comment
+# lines only are skipped. Every position is
+# played with Game.play under each time budget, without the depth ladder's limit so that
+# the budget decides how deep it goes, the evaluation noise seeded for every position so
+# that runs repeat as far as the clock allows. For each one the move, whether it is the
+# expected one, the iteration from which the expected move stayed the best (the solution
+# depth), the nodes and time up to the end of that iteration, the depth reached and the
+# nodes are recorded; per budget the solve rate and totals. The solution depth and nodes
+# do not depend on the clock at a fixed seed, the times do. A solved position that is no
+# longer solved, is solved at a greater depth, with more than TOLERANCE times the nodes,
+# or, where it took at least MIN_TIMED seconds, more than TOLERANCE times slower, is a
+# regression, and the exit status is 1 when there is any.
+import argparse
+import json
+import os
+import sys
+import time
+
+from checker_ai_bot import Game, GameType, Player, seed_noise
+
+SUITE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_suite.txt")
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_baseline.json")
+BUDGETS = (0.5, 2.0)  # seconds per position
+MAX_DEPTH = 32  # deepest iteration, far beyond what the budgets reach
+TOLERANCE = 1.5
+MIN_TIMED = 1.0  # shorter solution times are mostly timing noise and are not compared
+
+
+# [(name, rows, side, expected output)] of the suite file
+def read_suite(path):
+    positions = []
+    with open(path) as f:
+        blocks = f.read().strip().split("\n\n")
+    for block in blocks:
+        lines = [line.strip() for line in block.strip().splitlines()]
+        if all(line.startswith("#") for line in lines):  # comment block
+            continue
+        name = lines[0].lstrip("#").strip()
+        side = Player.WHITE if lines[2] == "WHITE" else Player.BLACK
+        positions.append((name, lines[4:12], side, "\n".join(lines[12:])))
+    return positions
+
+
+# result of one position searched for budget seconds
+def solve(rows, side, expected, budget, seed):
+    seed_noise(seed)
+    game = Game()
+    game.gameType = GameType.SINGLE
+    game.turn = side
+    game.depth_limit = MAX_DEPTH
+    game.create_board_from_input([list(row) for row in rows])
+    game.start_time = time.time()
+    game.remaining_time = budget
+    game.allowed_time = game.start_time + budget
+    move = game.play()
+    elapsed = time.time() - game.start_time
+
+    solved = move == expected
+    solution_time = elapsed if solved else None
+    solution_depth = solution_nodes = None
+    if solved:
+        solution_depth, solution_nodes = game.depth_reached, game.nodes
+    if solved and game.time_manager is not None and game.time_manager.iterations:
+        # from the first iteration whose best move never changed again
+        iterations = game.time_manager.iterations
+        first = len(iterations)
+        while first > 0 and game.format_move(iterations[first - 1][3]) == expected:
+            first -= 1
+        if first < len(iterations):
+            solution_time = sum(iteration[1] for iteration in iterations[:first + 1])
+            solution_depth = iterations[first][0]
+            solution_nodes = sum(iteration[2] for iteration in iterations[:first + 1])
+    return {"move": move.replace("\n", " "), "solved": solved,
+            "time": round(solution_time, 4) if solution_time is not None else None,
+            "solution_depth": solution_depth, "solution_nodes": solution_nodes,
+            "depth": game.depth_reached, "nodes": game.nodes, "source": game.move_source}
+
+
+def run(positions, budgets, seed):
+    results = {}
+    for budget in budgets:
+        per_position = {}
+        for name, rows, side, expected in positions:
+            result = solve(rows, side, expected, budget, seed)
+            per_position[name] = result
+            print("{:>5}s {:<20} {:<8} {:<16} depth {:>2} {:>9} nodes  {}".format(
+                budget, name, "solved" if result["solved"] else "missed", result["move"], result["depth"],
+                result["nodes"], "at depth {} after {} nodes, {:.3f}s".format(
+                    result["solution_depth"], result["solution_nodes"], result["time"]) if result["solved"] else ""))
+        solved = [r for r in per_position.values() if r["solved"]]
+        results[str(budget)] = {
+            "positions": per_position,
+            "solve_rate": round(len(solved) / len(per_position), 4),
+            "mean_time": round(sum(r["time"] for r in solved) / len(solved), 4) if solved else None,
+            "mean_depth": round(sum(r["depth"] for r in per_position.values()) / len(per_position), 2),
+            "nodes": sum(r["nodes"] for r in per_position.values()),
+        }
+    return results
+
+
+# regressions of results against the baseline, as messages
+def compare(results, baseline):
+    regressions = []
+    for budget, summary in results.items():
+        if budget not in baseline:
+            continue
+        before = baseline[budget]
+        for name, result in summary["positions"].items():
+            old = before["positions"].get(name)
+            if old is None or not old["solved"]:
+                continue
+            if not result["solved"]:
+                regressions.append("{}s {}: no longer solved, plays {}".format(budget, name, result["move"]))
+            elif result["solution_depth"] > old["solution_depth"]:
+                regressions.append("{}s {}: solved at depth {}, was {}".format(
+                    budget, name, result["solution_depth"], old["solution_depth"]))
+            elif result["solution_nodes"] > old["solution_nodes"] * TOLERANCE:
+                regressions.append("{}s {}: solved after {} nodes, was {}".format(
+                    budget, name, result["solution_nodes"], old["solution_nodes"]))
+            elif old["time"] >= MIN_TIMED and result["time"] > old["time"] * TOLERANCE:
+                regressions.append("{}s {}: solved in {:.3f}s, was {:.3f}s".format(
+                    budget, name, result["time"], old["time"]))
+        if summary["solve_rate"] < before["solve_rate"]:
+            regressions.append("{}s: solve rate {:.0%}, was {:.0%}".format(
+                budget, summary["solve_rate"], before["solve_rate"]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="time the engine to the best move of a position suite")
+    parser.add_argument("--suite", default=SUITE_FILE)
+    parser.add_argument("--time", type=float, action="append", help="seconds per position, may be repeated")
+    parser.add_argument("--position", action="append", help="run only this position, may be repeated")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the evaluation noise")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    positions = [p for p in read_suite(args.suite) if not args.position or p[0] in args.position]
+    if not positions:
+        parser.error("no positions to run")
+    results = run(positions, args.time or BUDGETS, args.seed)
+    for budget, summary in results.items():
+        print("{}s: solved {:.0%}, mean time to solution {}, mean depth {}, {} nodes".format(
+            budget, summary["solve_rate"],
+            "{:.3f}s".format(summary["mean_time"]) if summary["mean_time"] is not None else "-",
+            summary["mean_depth"], summary["nodes"]))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+        print("baseline written to " + args.baseline)
+    elif os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f))
+        for message in regressions:
+            print("REGRESSION " + message)
+        if regressions:
+            sys.exit(1)
+        print("no regressions against " + args.baseline)
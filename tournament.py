@@ -0,0 +1,187 @@
+# Self-play match between two engine configurations, to tell whether a change is worth
+# its cost.
+#
+#   python tournament.py --a "depth=6" --b "depth=5" --games 200 --clock 30 --processes 8
+#   python tournament.py --a "ordering=off" --b "" --opening-plies 3
+#
+# A configuration is a comma separated list of key=value settings of a Game:
+#   depth=N       deepest iteration searched (Game.depth_limit)
+#   clock=S       seconds on its clock for the whole game, overriding --clock
+#   ordering=off  no move orderer, moves searched in generation order
+#   endgame=off   no endgame database probes
+#   quiescence=off  leaves evaluated at the nominal depth even with a jump pending
+#   lmr=on|off, futility=on|off, extensions=on|off  selective search features
+#   tt=MB         transposition table size
+# Every opening (all positions after --opening-plies plies from the start) is played
+# twice with the colours swapped. Each side has a GAME mode clock: the engine is given
+# its remaining time and splits it with Game.update_allowed_move_time like in a real
+# game, and loses when it runs out. Games run in parallel across a process pool.
+import argparse
+import math
+import multiprocessing
+import time
+
+from checker_ai_bot import (Game, GameType, Player, TranspositionTable, START_POSITION, opponent_of,
+                            self_play_game)
+
+MAX_PLIES = 300    # longer games are draws
+REPETITIONS = 3    # so is a position seen this many times with the same side to move
+
+
+def parse_config(text):
+    config = {}
+    for item in text.split(","):
+        if item.strip():
+            key, value = item.split("=")
+            config[key.strip()] = value.strip()
+    return config
+
+
+# Game of config, around the tables of its earlier moves if given
+def make_game(config, tt=None, move_orderer=None):
+    if tt is None and "tt" in config:
+        tt = TranspositionTable(int(config["tt"]))
+    game = Game(tt, move_orderer)
+    game.gameType = GameType.GAME
+    game.create_board_from_input([list(row) for row in START_POSITION])
+    if "depth" in config:
+        game.depth_limit = int(config["depth"])
+    if config.get("ordering") == "off":
+        game.move_orderer = None
+    if config.get("endgame") == "off":
+        game.endgame_db = None
+    if config.get("quiescence") == "off":
+        game.use_quiescence = False
+    for key, attribute in (("lmr", "use_lmr"), ("futility", "use_futility"), ("extensions", "use_extensions")):
+        if key in config:
+            setattr(game, attribute, config[key] == "on")
+    return game
+
+
+# move sequences of every line of the given length from the start position
+def opening_lines(plies):
+    game = make_game({})
+    lines = [[]]
+    for ply in range(plies):
+        extended = []
+        for line in lines:
+            board = game.gameBoard
+            undos = []
+            player = Player.BLACK
+            for move in line:
+                undos.append(board.push(move, player))
+                player = opponent_of(player)
+            for move in game.get_all_moves(board, player):
+                extended.append(line + [move])
+            for undo in reversed(undos):
+                board.pop(undo)
+        lines = extended
+    return lines
+
+
+# one game; returns (score of configuration a, per-side [depth sum, searches, nodes, search time])
+def play_game(task):
+    opening, a_is_black, configs, clock = task
+    black = 0 if a_is_black else 1
+    sides = {Player.BLACK: black, Player.WHITE: 1 - black}  # configuration playing each colour
+    clocks = [float(config.get("clock", clock)) for config in configs]
+    stats = [[0, 0, 0, 0.0], [0, 0, 0, 0.0]]
+    seen = {}
+    flagged = []  # the configuration whose clock ran out
+
+    def new_game(player, tt, move_orderer):
+        return make_game(configs[sides[player]], tt, move_orderer)
+
+    def choose(game, ply):
+        side = sides[game.turn]
+        key = game.gameBoard.get_key(game.turn)
+        seen[key] = seen.get(key, 0) + 1
+        if seen[key] >= REPETITIONS:
+            return None
+        game.remaining_time = clocks[side]
+        game.start_time = time.time()
+        game.update_allowed_move_time()
+        move = game.get_best_move()
+        elapsed = time.time() - game.start_time
+        clocks[side] -= elapsed
+        if clocks[side] <= 0:
+            flagged.append(side)
+            return None
+        if game.time_manager is not None and game.time_manager.iterations:
+            stats[side][0] += game.time_manager.iterations[-1][0]
+            stats[side][1] += 1
+            stats[side][2] += game.nodes
+            stats[side][3] += elapsed
+        return move
+
+    winner = self_play_game(new_game, choose, MAX_PLIES, opening)
+    if flagged:
+        return (0.0 if flagged[0] == 0 else 1.0), stats
+    if winner is None:
+        return 0.5, stats
+    return (1.0 if sides[winner] == 0 else 0.0), stats
+
+
+# Elo difference of a score fraction
+def elo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+# (elo, low, high) with a 95% interval from the spread of the game results
+def elo_interval(results):
+    n = len(results)
+    mean = sum(results) / n
+    deviation = math.sqrt(sum((r - mean) ** 2 for r in results) / n)
+    margin = 1.96 * deviation / math.sqrt(n)
+    return elo(mean), elo(mean - margin), elo(mean + margin)
+
+
+def run_match(configs, games, clock, opening_plies, processes):
+    lines = opening_lines(opening_plies)
+    tasks = []
+    while len(tasks) < games:
+        for line in lines:
+            for a_is_black in (True, False):
+                if len(tasks) < games:
+                    tasks.append((line, a_is_black, configs, clock))
+
+    results = []
+    totals = [[0, 0, 0, 0.0], [0, 0, 0, 0.0]]
+    pool = multiprocessing.Pool(processes)
+    try:
+        for score, stats in pool.imap_unordered(play_game, tasks):
+            results.append(score)
+            for side in (0, 1):
+                for i in range(4):
+                    totals[side][i] += stats[side][i]
+            wins = results.count(1.0)
+            draws = results.count(0.5)
+            print("game {}/{}: +{} ={} -{}".format(len(results), len(tasks), wins, draws, len(results) - wins - draws))
+    finally:
+        pool.close()
+        pool.join()
+    return results, totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="play two engine configurations against each other")
+    parser.add_argument("--a", default="", help="configuration of engine A")
+    parser.add_argument("--b", default="", help="configuration of engine B")
+    parser.add_argument("--games", type=int, default=98)
+    parser.add_argument("--clock", type=float, default=60.0, help="seconds per side for the whole game")
+    parser.add_argument("--opening-plies", type=int, default=2)
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    configs = (parse_config(args.a), parse_config(args.b))
+    start = time.time()
+    results, totals = run_match(configs, args.games, args.clock, args.opening_plies, args.processes)
+    wins = results.count(1.0)
+    draws = results.count(0.5)
+    print("A {!r} vs B {!r}: {} games in {:.0f}s".format(args.a, args.b, len(results), time.time() - start))
+    print("A wins {} draws {} losses {}".format(wins, draws, len(results) - wins - draws))
+    print("Elo A - B: {:+.1f} (95% {:+.1f} .. {:+.1f})".format(*elo_interval(results)))
+    for name, (depth, searches, nodes, seconds) in zip("AB", totals):
+        print("{}: average depth {:.2f}, {:.0f} nodes/s".format(
+            name, depth / max(searches, 1), nodes / max(seconds, 1e-9)))
@@ -0,0 +1,288 @@
+# Fits the evaluation weights of checker_ai_bot to game results (Texel tuning) and writes
+# the weight file the engine loads at import.
+#
+#   python tune_eval.py generate --games 500 --depth 4 --output positions.jsonl
+#   python tune_eval.py tune positions.jsonl --output eval_weights.json
+#
+# generate plays engine games, with a few random moves at the start so that they differ,
+# and writes every quiet position (no jump for the side to move) as a JSON line
+#   {"position": [8 rows], "side": "BLACK", "result": 1.0}
+# with the result for the side to move: 1 win, 0.5 draw, 0 loss. Records from elsewhere in
+# that format can be tuned on as well.
+#
+# tune reads the positions as a stream, CHUNK at a time, and extracts the evaluation
+# features of every chunk with numpy into a float32 matrix kept in a memory mapped file,
+# so memory stays the same whatever the number of positions. The evaluation of a position
+# is then the matrix row times the weights (king_row_dist without its rounding down) and
+# its predicted result sigmoid(evaluation / scale). The scale is fitted first with the
+# current weights, then the weights by full batch gradient descent (Adam) on the squared
+# error between predicted and actual results, a chunk of the matrix at a time.
+# The edge and pieces features count both sides alike: they add the same to the evaluation
+# of either side, say nothing about who wins and are left out of the fit, keeping their
+# weights.
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from checker_ai_bot import (Game, GameType, Player, EVAL_WEIGHTS, EVAL_WEIGHTS_FILE, SQUARE_ROW, SQUARE_COL,
+                            DIRECTIONS, EDGE_MASK, FULL_MASK, square, advance_table, get_numpy, batch_popcount,
+                            batch_count_jumps, opponent_of, self_play_game)
+
+FEATURES = ("edge", "opponent_jumps", "opponent_no_jump", "opponent_blocked", "jumps",
+            "pieces", "material", "kings", "advance", "near_promotion")
+SYMMETRIC_FEATURES = ("edge", "pieces")
+CHUNK = 65536  # positions read and extracted at a time
+np = get_numpy()  # None when missing, tune then stops
+
+
+def board_rows(board):
+    rows = [["."] * 8 for r in range(8)]
+    for player, man, king in ((Player.WHITE, "w", "W"), (Player.BLACK, "b", "B")):
+        for sq in range(32):
+            if board.men[player] >> sq & 1:
+                rows[SQUARE_ROW[sq]][SQUARE_COL[sq]] = man
+            elif board.kings[player] >> sq & 1:
+                rows[SQUARE_ROW[sq]][SQUARE_COL[sq]] = king
+    return ["".join(row) for row in rows]
+
+
+# (white men, black men, white kings, black kings) of rows in the input.txt format
+def rows_planes(rows):
+    planes = [0, 0, 0, 0]
+    plane = {"w": 0, "b": 1, "W": 2, "B": 3}
+    for r, row in enumerate(rows):
+        for c, char in enumerate(row):
+            if char in plane:
+                planes[plane[char]] |= 1 << square(r, c)
+    return tuple(planes)
+
+
+####################### Positions ###################################################
+# one engine game; writes its quiet positions to out and returns how many
+def self_play(out, depth, move_time, random_plies, max_plies):
+    positions = []
+
+    def new_game(player, tt, move_orderer):
+        game = Game(tt, move_orderer)
+        game.gameType = GameType.GAME
+        game.depth_limit = depth
+        return game
+
+    def choose(game, ply):
+        moves = game.get_all_moves(game.gameBoard, game.turn)
+        if not moves[0][2]:
+            positions.append((board_rows(game.gameBoard), game.turn))
+        if ply < random_plies:
+            return random.choice(moves)
+        game.start_time = time.time()
+        game.remaining_time = move_time * 10
+        game.allowed_time = game.start_time + move_time
+        return game.get_best_move()
+
+    winner = self_play_game(new_game, choose, max_plies)
+    for rows, player in positions:
+        result = 0.5 if winner is None else float(winner == player)
+        out.write(json.dumps({"position": rows, "side": "BLACK" if player == Player.BLACK else "WHITE",
+                              "result": result}) + "\n")
+    return len(positions)
+
+
+####################### Features ####################################################
+# (n, len(FEATURES)) float32 matrix of the evaluation features of a batch of positions,
+# all seen from player; batch_evaluation(planes, player) is close to it times the weights
+def extract_features(planes, player):
+    men = (planes[0], planes[1])
+    kings = (planes[2], planes[3])
+    opponent = opponent_of(player)
+    pieces = (men[0] | kings[0], men[1] | kings[1])
+    occupied = pieces[0] | pieces[1]
+    empty = ~occupied & FULL_MASK
+    left = (batch_popcount(pieces[0]), batch_popcount(pieces[1]))
+
+    jumps, jumpers = batch_count_jumps(men, kings, opponent, empty)
+    movers = 0
+    for step, back, forward in DIRECTIONS:
+        movers = movers | (back(empty) & (pieces[opponent] if forward == opponent else kings[opponent]))
+    # rows advanced by the player's men, and men one row before promotion
+    squares = (men[player][:, None] >> np.arange(32, dtype=np.int64)) & 1
+    advance = squares @ np.array(advance_table(1, 0)[player], dtype=np.int64)
+    near = squares @ np.array(advance_table(0, 1)[player], dtype=np.int64)
+    own_left = np.maximum(left[player], 1)
+    columns = {
+        "edge": batch_popcount(occupied & EDGE_MASK),
+        "opponent_jumps": jumps,
+        "opponent_no_jump": left[opponent] - batch_popcount(jumpers),
+        "opponent_blocked": left[opponent] - batch_popcount(movers),
+        "jumps": batch_count_jumps(men, kings, player, empty)[0],
+        "pieces": left[0] + left[1],
+        "material": left[player] - left[opponent],
+        "kings": batch_popcount(kings[player]) - batch_popcount(kings[opponent]),
+        "advance": advance / own_left,
+        "near_promotion": near / own_left,
+    }
+    return np.stack([np.asarray(columns[name], dtype=np.float32) for name in FEATURES], axis=1)
+
+
+# (planes, player, result) of every JSON line of the stream
+def read_records(f):
+    for line in f:
+        if line.strip():
+            record = json.loads(line)
+            player = Player.WHITE if record.get("side", "BLACK") == "WHITE" else Player.BLACK
+            yield rows_planes(record["position"]), player, float(record["result"])
+
+
+# features and result of every position of f, CHUNK positions at a time, appended as float32
+# rows of len(FEATURES) + 1 columns to the file at path; returns the number of positions
+def extract_file(f, path):
+    count = 0
+    with open(path, 'wb') as out:
+        chunk = []
+        for record in read_records(f):
+            chunk.append(record)
+            if len(chunk) == CHUNK:
+                count += write_chunk(chunk, out)
+                chunk = []
+        if chunk:
+            count += write_chunk(chunk, out)
+    return count
+
+
+def write_chunk(chunk, out):
+    planes = np.array([planes for planes, player, result in chunk], dtype=np.int64).T
+    players = np.array([player for planes, player, result in chunk])
+    matrix = np.empty((len(chunk), len(FEATURES) + 1), dtype=np.float32)
+    for player in (Player.WHITE, Player.BLACK):
+        rows = np.nonzero(players == player)[0]
+        if len(rows):
+            matrix[rows, :-1] = extract_features(planes[:, rows], player)
+    matrix[:, -1] = [result for planes, player, result in chunk]
+    matrix.tofile(out)
+    return len(chunk)
+
+
+####################### Fitting #####################################################
+class Tuner:
+    def __init__(self, path, count):
+        self.data = np.memmap(path, dtype=np.float32, mode='r', shape=(count, len(FEATURES) + 1))
+        self.count = count
+        self.fitted = np.array([name not in SYMMETRIC_FEATURES for name in FEATURES])
+
+    # (features, results) of CHUNK positions at a time, only the fitted features
+    def chunks(self):
+        for start in range(0, self.count, CHUNK):
+            block = self.data[start:start + CHUNK]
+            yield block[:, :-1][:, self.fitted].astype(np.float64), block[:, -1].astype(np.float64)
+
+    # mean squared error of the predicted results
+    def loss(self, weights, scale):
+        total = 0.0
+        for features, results in self.chunks():
+            predicted = sigmoid(features @ weights / scale)
+            total += ((predicted - results) ** 2).sum()
+        return total / self.count
+
+    def gradient(self, weights, scale):
+        total = np.zeros(int(self.fitted.sum()))
+        for features, results in self.chunks():
+            predicted = sigmoid(features @ weights / scale)
+            total += features.T @ ((predicted - results) * predicted * (1 - predicted))
+        return total * 2 / (self.count * scale)
+
+    # the scale with the smallest loss, by ternary search over its logarithm
+    def fit_scale(self, weights, low=1.0, high=1000.0, steps=40):
+        low, high = np.log(low), np.log(high)
+        for i in range(steps):
+            a = low + (high - low) / 3
+            b = high - (high - low) / 3
+            if self.loss(weights, np.exp(a)) < self.loss(weights, np.exp(b)):
+                high = b
+            else:
+                low = a
+        return float(np.exp((low + high) / 2))
+
+    def fit_weights(self, weights, scale, epochs, rate, report=None):
+        weights = weights.copy()
+        moment = np.zeros_like(weights)
+        velocity = np.zeros_like(weights)
+        beta1, beta2 = 0.9, 0.999
+        for epoch in range(1, epochs + 1):
+            gradient = self.gradient(weights, scale)
+            moment = beta1 * moment + (1 - beta1) * gradient
+            velocity = beta2 * velocity + (1 - beta2) * gradient ** 2
+            step = moment / (1 - beta1 ** epoch) / (np.sqrt(velocity / (1 - beta2 ** epoch)) + 1e-12)
+            weights -= rate * step
+            if report and epoch % report == 0:
+                print("epoch {}: loss {:.6f}".format(epoch, self.loss(weights, scale)))
+        return weights
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def tune(f, output, features_path, epochs, rate):
+    if np is None:
+        sys.exit("tuning needs numpy")
+    start = time.time()
+    count = extract_file(f, features_path)
+    print("{} positions extracted in {:.1f}s".format(count, time.time() - start))
+    if not count:
+        sys.exit("no positions")
+
+    tuner = Tuner(features_path, count)
+    weights = np.array([EVAL_WEIGHTS[name] for name in FEATURES], dtype=np.float64)[tuner.fitted]
+    scale = tuner.fit_scale(weights)
+    print("scale {:.2f}, loss {:.6f}".format(scale, tuner.loss(weights, scale)))
+    weights = tuner.fit_weights(weights, scale, epochs, rate, report=max(epochs // 10, 1))
+    rounded = np.round(weights)
+    print("rounded weights: loss {:.6f}".format(tuner.loss(rounded, scale)))
+
+    result = dict(EVAL_WEIGHTS)
+    result.update((name, int(weight)) for name, weight in zip(np.array(FEATURES)[tuner.fitted], rounded))
+    for name in FEATURES:
+        print("{:<18} {:>4} -> {:>4}".format(name, EVAL_WEIGHTS[name], result[name]))
+    with open(output, 'w') as out:
+        json.dump(result, out, indent=2)
+        out.write("\n")
+    print("weights written to " + output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="fit the evaluation weights to game results")
+    commands = parser.add_subparsers(dest="command")
+    generate_parser = commands.add_parser("generate", help="write labelled positions from self-play")
+    generate_parser.add_argument("--games", type=int, default=100)
+    generate_parser.add_argument("--depth", type=int, default=4, help="deepest iteration of every move")
+    generate_parser.add_argument("--move-time", type=float, default=1.0, help="seconds per move at most")
+    generate_parser.add_argument("--random-plies", type=int, default=4, help="random moves opening each game")
+    generate_parser.add_argument("--max-plies", type=int, default=200, help="longer games are draws")
+    generate_parser.add_argument("--output", default="positions.jsonl", help="appended to")
+    tune_parser = commands.add_parser("tune", help="fit the weights to labelled positions")
+    tune_parser.add_argument("input", help="JSON lines of positions, - for stdin")
+    tune_parser.add_argument("--output", default=EVAL_WEIGHTS_FILE)
+    tune_parser.add_argument("--features", help="file for the feature matrix, a temporary one by default")
+    tune_parser.add_argument("--epochs", type=int, default=1000)
+    tune_parser.add_argument("--rate", type=float, default=0.1, help="Adam step size, in weight units")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        total = 0
+        with open(args.output, 'a') as out:
+            for i in range(args.games):
+                total += self_play(out, args.depth, args.move_time, args.random_plies, args.max_plies)
+                print("game {}: {} positions".format(i + 1, total))
+    elif args.command == "tune":
+        with tempfile.TemporaryDirectory() as directory:
+            features_path = args.features or os.path.join(directory, "features.f32")
+            if args.input == "-":
+                tune(sys.stdin, args.output, features_path, args.epochs, args.rate)
+            else:
+                with open(args.input) as f:
+                    tune(f, args.output, features_path, args.epochs, args.rate)
+    else:
+        parser.print_help()